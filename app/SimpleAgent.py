@@ -2,11 +2,15 @@
 #==============维护ReAct循环主逻辑，组装上下文、调用llm、执行工具并记录结果=====================
 from abc import ABC, abstractmethod
 from pydantic import BaseModel, Field,ValidationError
-from typing import List, Optional, Any,Literal,TypeVar,Type,Dict
+from typing import List, Optional, Any,Literal,TypeVar,Type,Dict,get_args
 from llm_client import HelloAgentLLM
 from tools.registry import ToolRegistry # 假设你把新代码存在了 tools/registry.py
+from json_stream import IncrementalJSONArrayParser
+from context_manager import ContextBudget
+from structured_output import StructuredOutputParser, apply_local_fixes, compact_schema
+from metrics import span, PARSE_SECONDS
+import asyncio
 import json
-import re
 
 T = TypeVar("T", bound=BaseModel)
 class Message:
@@ -25,9 +29,19 @@ class Message:
 
 class Config:
     """Agent 配置类"""
-    def __init__(self, temperature: float = 0.7, max_tokens: int = 4096):
+    def __init__(self, temperature: float = 0.7, max_tokens: int = 4096,
+                 tool_timeout: float = 30.0, default_tool_concurrency: int = 4,
+                 tool_concurrency: Optional[Dict[str, int]] = None,
+                 context_token_budget: int = 6000, compact_tool_tokens: int = 150,
+                 structured_repair_attempts: int = 2):
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.tool_timeout = tool_timeout                          # 单次工具调用超时(秒)
+        self.default_tool_concurrency = default_tool_concurrency  # 每个工具默认的并发上限
+        self.tool_concurrency = tool_concurrency or {}            # 按工具名单独覆盖并发上限
+        self.context_token_budget = context_token_budget          # 每次请求 messages 的 token 预算
+        self.compact_tool_tokens = compact_tool_tokens            # 超预算时旧工具结果压缩到的 token 数
+        self.structured_repair_attempts = structured_repair_attempts  # 结构化输出校验失败时最多请求 LLM 修正的次数
 
 class SimpleAgent(ABC):
     def __init__(
@@ -42,8 +56,11 @@ class SimpleAgent(ABC):
         self.system_prompt = system_prompt
         self.config = config or Config()
         self._history: List[Message] = []
+        self.prompt_tokens_saved = 0  # 上下文压缩累计少发送的 prompt token 数
         # --- 核心修改：使用注册表代替普通字典 ---
         self.tool_registry = ToolRegistry()
+        # 每个工具一个信号量，限制同一工具的并发调用数
+        self._tool_semaphores: Dict[str, asyncio.Semaphore] = {}
     
     async def add_tool(self, tool: Any):
         """通过注册表添加工具，支持异步展开"""
@@ -58,17 +75,20 @@ class SimpleAgent(ABC):
         self._history.clear()
 
     #ReAct模式的主循环逻辑
-    async def run(self, input_text: str, max_iterations:int = 5,**kwargs) -> str:
+    async def run(self, input_text: str, max_iterations:int = 5, system_prompt: Optional[str] = None,
+                  **kwargs) -> str:
         """
         Agent 的核心运行逻辑：
         1. 组装消息上下文
         2. 调用 LLM
         3. 如果 LLM 要求调用工具，执行工具并再次调用 LLM
+        system_prompt 可覆盖本次运行的 system 消息（如附带输出结构的版本）
         """
-        # 构造发送给 LLM 的消息列表
+        # 构造发送给 LLM 的消息列表：固定内容（system、工具说明）在前，本次请求的内容在后
         messages = []
-        if self.system_prompt:
-            messages.append({"role": "system", "content": self.system_prompt})
+        system_prompt = system_prompt or self.system_prompt
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
         
         # 添加历史记录
         # for m in self._history:
@@ -79,15 +99,19 @@ class SimpleAgent(ABC):
         messages.append({"role": "user", "content": input_text})
         self.add_message(Message(role="user", content=input_text))
 
+        #给LLM看每个工具的说明书，让LLM知道有什么工具，需要哪些参数
+        #直接从注册表获取所有工具说明，注册表内已缓存，循环内复用同一份
+        tool_schemas = self.tool_registry.get_all_tool_schemas() #tool_registry是一个batch，其中的列表包含了多个mcptool实例，通过类方法得到所有工具的说明书
+
+        # 本次运行的 token 预算：超出时压缩较早的工具结果
+        budget = ContextBudget(self.config.context_token_budget, self.config.compact_tool_tokens)
+
         # 迭代循环（处理工具调用）
         current_iteration = 0
         while current_iteration < max_iterations:  # 限制最大思考深度，防止死循环
 
             current_iteration += 1
-            #给LLM看每个工具的说明书，让LLM知道有什么工具，需要哪些参数
-            #直接从注册表获取所有工具说明
-            tool_schemas = self.tool_registry.get_all_tool_schemas() #tool_registry是一个batch，其中的列表包含了多个mcptool实例，通过类方法得到所有工具的说明书
-            #tool_schemas = [t.to_dict() for t in self.tools.values()] if self.tools else None #之前的说明书实现在agent内部，现在解耦到注册表中实现。agent只需要接收写好的说明书
+            self.prompt_tokens_saved += budget.fit(messages)
             
             # 调用 LLM 客户端，返回LLM的content和tools_call
             # 注意：这里需要根据你实际的 llm_client 接口调整
@@ -129,65 +153,114 @@ class SimpleAgent(ABC):
                 return response.content #最终回复
 
             # llm_client已经将LLM的返回解析为JSON格式并存为tool_calls列表
-            # agent解析LLM调用的工具 遍历每个tool_call执行工具
-            # 工具类变得更通用，GitHubMCPTool 或 GoogleSearchTool的接口是一样的
-            for tool_call in response.tool_calls:
-                tool_name = tool_call.function.name
-                # 从注册表检索对应的工具对象
-                tool_obj = self.tool_registry.get_tool(tool_name)
-                
-                if tool_obj:
-                    observation = await tool_obj.run(**tool_call.function.arguments)
-                    print(f"  > 工具返回结果摘要: {str(observation)[:50]}...") # 新增：确认工具结果
-                    #等于调用 bridge_tool.run(**tool_args) 是异步的，需要await
-                    #print(f"  > Agent [{self.name}] 正在调用工具: {tool_name}")
-                    #observation = await self.tools[tool_name].run(**tool_args) #Bridge 对象调用 session.call_tool，通过标准输入输出 (Stdio) 将指令发送给高德 MCP 服务。
-                    # 将工具结果反馈给 LLM
-                    tool_msg = {
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "name": tool_name,
-                        "content": str(observation)
-                    }
-                    #在 OpenAI 的协议中，tool 角色的消息不能孤立存在，它必须紧跟在一个带有 tool_calls 列表的 assistant 消息之后。
-                    messages.append(tool_msg) #工具调用结果
-                    self.add_message(Message(role="tool", content=str(observation))) #加入历史,没有把 tool_call_id 存进去
+            # 同一轮的多个工具调用并发执行，gather 保证结果顺序与 tool_calls 一致
+            observations = await asyncio.gather(
+                *(self._execute_tool_call(tc) for tc in response.tool_calls)
+            )
+            for tool_call, observation in zip(response.tool_calls, observations):
+                # 将工具结果反馈给 LLM
+                tool_msg = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "name": tool_call.function.name,
+                    "content": str(observation)
+                }
+                #在 OpenAI 的协议中，tool 角色的消息不能孤立存在，它必须紧跟在一个带有 tool_calls 列表的 assistant 消息之后。
+                messages.append(tool_msg) #工具调用结果
+                # 工具原文只保留在 messages 中，不再往 _history 里重复存一份
             
             #print(f"message列表:{messages}")
         
         return "达到最大迭代次数，未能完成任务。"
 
+    def _get_tool_semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        if tool_name not in self._tool_semaphores:
+            limit = self.config.tool_concurrency.get(tool_name, self.config.default_tool_concurrency)
+            self._tool_semaphores[tool_name] = asyncio.Semaphore(limit)
+        return self._tool_semaphores[tool_name]
+
+    async def _execute_tool_call(self, tool_call) -> str:
+        """执行单个工具调用；超时或异常都转成文本结果，保证每个 tool_call_id 都有回应"""
+        tool_name = tool_call.function.name
+        # 从注册表检索对应的工具对象
+        tool_obj = self.tool_registry.get_tool(tool_name)
+        if not tool_obj:
+            return f"错误：工具 '{tool_name}' 不存在。"
+
+        try:
+            async with self._get_tool_semaphore(tool_name):
+                #等于调用 bridge_tool.run(**tool_args) 是异步的，需要await
+                observation = await asyncio.wait_for(
+                    tool_obj.run(**tool_call.function.arguments),
+                    timeout=self.config.tool_timeout
+                )
+        except asyncio.TimeoutError:
+            observation = f"工具 '{tool_name}' 调用超时（>{self.config.tool_timeout}s）。"
+        except Exception as e:
+            observation = f"工具 '{tool_name}' 调用失败: {e}"
+        print(f"  > 工具返回结果摘要: {str(observation)[:50]}...") # 新增：确认工具结果
+        return observation
+
+    def _structured_system_prompt(self, response_model: Type[BaseModel]) -> str:
+        """
+        把输出结构放进 system 消息：它与 system prompt 一样每次请求都相同，
+        放在每次变化的用户内容之前，才能命中 LLM 服务端的前缀缓存。
+        """
+        return (f"{self.system_prompt or ''}\n\n"
+                f"## 输出格式\n"
+                f"只输出一个符合 {response_model.__name__} 结构的 JSON 对象，不要包含任何 Markdown 标签或解释文字。"
+                f"字段如下（? 表示可省略，X[] 表示数组，# 后为说明）：\n"
+                f"{compact_schema(response_model)}")
+
+    async def _parse_structured(self, raw_response: str, response_model: Type[T]) -> T:
+        # 提取 -> 本地修正 -> 只针对出错片段请求 LLM 修正，避免一次格式错误导致整个规划重跑
+        parser = StructuredOutputParser(self.llm, max_repairs=self.config.structured_repair_attempts,
+                                        max_tokens=self.config.max_tokens)
+        with span("structured.parse", PARSE_SECONDS, model=response_model.__name__, chars=len(raw_response)) as s:
+            result = await parser.parse(raw_response, response_model)
+            if parser.attempts:
+                s.set(outcome="repaired", repairs=parser.attempts)
+            return result
+
     async def run_structured(self, user_query: str, response_model: Type[T]) -> T:
         """
         1. 运行 ReAct 逻辑获取最终答案
         2. 强制解析答案为 Pydantic 模型
         """
-        # 告知 LLM 必须返回 JSON 格式
-        schema_json = json.dumps(response_model.model_json_schema(), ensure_ascii=False)#Pydantic模型会递归解析所有嵌套字段，生成完整的结构化Schema
-        structured_query = (f"{user_query}\n\n"
-            f"请严格按照以下 JSON Schema 格式回复，不要包含任何 Markdown 标签或解释文字：\n"
-            f"{schema_json}"
-        )
-        raw_response = await self.run(structured_query) 
-        
-        # 清洗 Markdown 标签 (如果有)
-        clean_json = raw_response.strip()
-        json_match = re.search(r'\{.*\}', clean_json, re.DOTALL)
-        if json_match:
-            clean_json = json_match.group(0)
-        else:
-            clean_json = raw_response.strip()
-        print(clean_json)
-        
-        #if "```" in clean_json:
-        #    clean_json = re.sub(r'```json\s*|\s*```', '', clean_json).strip()
-        
-        try:
-            data = json.loads(clean_json,strict=False)
-            return response_model.model_validate(data)#LLM返回JSON后，Pydantic会递归验证每个字段类型，自动转换类型并抛出明确的验证错误
-        except ValidationError as e:
-            print(f"解析失败: {e}，原始回复: {raw_response}")
-            raise ValueError("AI 返回的格式不符合预期模型")
+        raw_response = await self.run(user_query, system_prompt=self._structured_system_prompt(response_model))
+        return await self._parse_structured(raw_response, response_model)
+
+    async def run_structured_stream(self, user_query: str, response_model: Type[T],
+                                    item_key: str = "days", item_model: Optional[Type[BaseModel]] = None):
+        """
+        流式结构化输出：边接收 token 边解析，response_model 中 item_key 数组的每个元素
+        一闭合就用 item_model 校验并 yield；最后 yield 完整的 response_model 实例。
+        流式模式只做一次生成、不调用工具，适合输入信息已齐备的规划阶段。
+        """
+        if item_model is None:
+            # 从字段注解推断元素类型，如 List[DayPlan] -> DayPlan
+            item_model = get_args(response_model.model_fields[item_key].annotation)[0]
+
+        messages = [
+            {"role": "system", "content": self._structured_system_prompt(response_model)},
+            {"role": "user", "content": user_query},
+        ]
+
+        parser = IncrementalJSONArrayParser(item_key)
+        async for chunk in self.llm.stream_response(
+            messages=messages,
+            max_tokens=self.config.max_tokens,
+            temperature=self.config.temperature
+        ):
+            for item in parser.feed(chunk):
+                apply_local_fixes(item, item_model)
+                try:
+                    yield item_model.model_validate(item)
+                except ValidationError as e:
+                    # 单个元素不合法时先跳过，最终整体校验会给出完整错误
+                    print(f"流式元素校验失败: {e}")
+
+        yield await self._parse_structured(parser.text, response_model)
 
     def __str__(self) -> str:
         return f"Agent(name={self.name})"
\ No newline at end of file
@@ -1,55 +1,124 @@
+import json
 import asyncio
-from mcp import ClientSession
-from typing import List
+from mcp_pool import MCPServerPool
+from metrics import span, TOOL_SECONDS
+from poi_store import current_poi_store
+from prefetch import current_prefetcher
+from typing import Any, Dict, List, Optional
+
+
+class ToolResult(str):
+    """
+    工具返回值：字符串内容是给 LLM 阅读的文本（Agent 照常把它当作 observation），
+    records 为机器可读的 POI 记录，data 为其他结构化结果（如天气、路线距离）。
+    """
+    records: List[Dict[str, Any]]
+    data: Optional[Dict[str, Any]]
+
+    def __new__(cls, text: str, records: Optional[List[Dict[str, Any]]] = None,
+                data: Optional[Dict[str, Any]] = None):
+        obj = super().__new__(cls, text)
+        obj.records = records or []
+        obj.data = data
+        return obj
+
+    @classmethod
+    def from_payload(cls, raw: str) -> "ToolResult":
+        """解析服务端的 {"text", "records", "data"}；旧格式或错误信息等纯文本原样返回"""
+        if raw.startswith("{"):
+            try:
+                payload = json.loads(raw)
+            except json.JSONDecodeError:
+                payload = None
+            if isinstance(payload, dict) and isinstance(payload.get("text"), str):
+                return cls(payload["text"], payload.get("records"), payload.get("data"))
+        return cls(raw)
+
 
 class AmapMCPTool:
     """单个工具的执行实体"""
-    def __init__(self, mcp_client_session, mcp_tool_info):
-        self.session = mcp_client_session
+    def __init__(self, mcp_pool, mcp_tool_info):
+        self.pool = mcp_pool  # MCPServerPool，每次调用从池中取一个会话
         self.name = mcp_tool_info.name
         self.description = mcp_tool_info.description
         self.input_schema = mcp_tool_info.inputSchema #初始化时自动读取MCP服务端定义的inputSchema
+        self._schema = None
 
     def to_dict(self):
         """转换为你的 llm_client 需要的 OpenAI 工具格式"""
-        """OpenAI 期望的 JSON Schema 格式"""
-        return {
-            "type": "function",
-            "function": {
-                "name": self.name,
-                "description": self.description,
-                "parameters": self.input_schema
+        """OpenAI 期望的 JSON Schema 格式，只生成一次"""
+        if self._schema is None:
+            self._schema = {
+                "type": "function",
+                "function": {
+                    "name": self.name,
+                    "description": self.description,
+                    "parameters": self.input_schema
+                }
             }
-        }
+        return self._schema
 
     async def run(self, **kwargs):
+        """Agent 调用工具的入口：优先复用本次规划预取的结果，记录写入本次规划的 POI 存储"""
+        prefetcher = current_prefetcher()
+        tool_result = await prefetcher.lookup(self, kwargs) if prefetcher else None
+        if tool_result is None:
+            tool_result = await self.call(**kwargs)
+        store = current_poi_store()
+        if store is not None and tool_result.records:
+            store.add(tool_result.records, source=self.name)
+        if store is not None and isinstance(tool_result.data, dict) and tool_result.data.get("forecasts"):
+            store.add_forecasts(tool_result.data["forecasts"])
+        return tool_result
+
+    async def call(self, **kwargs) -> "ToolResult":
         """直接使用异步调用 MCP 工具"""
-        # 确保 session.call_tool 是异步调用的
-        result = await self.session.call_tool(self.name, arguments=kwargs)
-        # MCP 返回通常是 content 列表，提取文本内容
-        return result.content[0].text if result.content else ""
+        # 从进程池取出最空闲的会话，session.call_tool 是异步调用的
+        with span("tool.call", TOOL_SECONDS, tool=self.name) as s:
+            async with self.pool.acquire() as session:
+                result = await session.call_tool(self.name, arguments=kwargs)
+            if getattr(result, "isError", False):
+                s.set(outcome="error")
+        # MCP 返回通常是 content 列表，提取文本内容并拆出结构化记录
+        return ToolResult.from_payload(result.content[0].text if result.content else "")
+
+class MCPToolCatalog:
+    """共享的工具目录：只调用一次 list_tools，所有 Agent 从中按关键字筛选"""
+    def __init__(self, mcp_pool: MCPServerPool):
+        self.pool = mcp_pool
+        self._tools: Optional[List[AmapMCPTool]] = None
+        self._lock = asyncio.Lock()
+
+    async def get_tools(self) -> List[AmapMCPTool]:
+        if self._tools is None:
+            async with self._lock:
+                if self._tools is None:
+                    # 调用 MCP 协议获取工具列表
+                    mcp_tools_resp = await self.pool.list_tools()
+                    self._tools = [AmapMCPTool(self.pool, t) for t in mcp_tools_resp.tools]
+        return self._tools
 
 class AmapMCPBatch:
     """MCP 工具包：负责发现并展开所有工具"""
-    def __init__(self, mcp_client_session: ClientSession,include_keywords:list = None):
-        self.session = mcp_client_session
+    def __init__(self, mcp_pool: MCPServerPool, include_keywords:list = None,
+                 catalog: Optional[MCPToolCatalog] = None):
+        self.pool = mcp_pool
         self.auto_expand = True  # 标记为可自动展开
         self.include_keywords = include_keywords
+        self.catalog = catalog or MCPToolCatalog(mcp_pool)
 
     async def get_expanded_tools(self) -> List[AmapMCPTool]:
-        """从 MCP 会话中拉取所有可用工具并封装"""
-        """每个工具只做一次，避免多个agent重复封装"""
-        # 调用 MCP 协议获取工具列表
-        mcp_tools_resp = await self.session.list_tools()
+        """从共享工具目录中筛选工具"""
+        """每个工具只封装一次，多个agent复用同一个工具实例"""
         expanded = []
-        for t in mcp_tools_resp.tools:
+        for t in await self.catalog.get_tools():
             # 逻辑：如果没有指定关键字，则加载全部；如果指定了，则匹配名称
             should_include = True
             if self.include_keywords:
                 should_include = any(kw in t.name for kw in self.include_keywords)
             
             if should_include:
-                expanded.append(AmapMCPTool(self.session, t))
+                expanded.append(t)
 
         return expanded
         #返回mcptool工具实例列表
\ No newline at end of file
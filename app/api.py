@@ -2,17 +2,27 @@
 import os
 import re
 import json
-from fastapi import FastAPI, HTTPException, Query
+import time
+import asyncio
+from typing import Any
+from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Response, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp import StdioServerParameters
+from mcp_pool import MCPServerPool
 from datetime import datetime
-from models.schemas import TripRequest,TripPlan,Budget
+from models.schemas import TripRequest,TripPlan,Budget,POIPhotoBatchRequest
 
 
 # 导入你之前的组件
 from trip_planner import TripMaster
-from llm_client import HelloAgentLLM
+from poi_photos import POIPhotoResolver
+from cache.plan_cache import PlanCache
+from cache.ttl_cache import TTLCache, cache_db_path
+from job_queue import PlanJobQueue, QueueFullError
+from llm_client import HelloAgentLLM, close_shared_http_client
+from metrics import REGISTRY, HTTP_SECONDS, trace_id_var, new_trace_id
 from dotenv import load_dotenv
 #import traceback
 load_dotenv()
@@ -29,108 +39,364 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],        # 允许所有方法 (GET, POST 等)
     allow_headers=["*"],        # 允许所有请求头
+    expose_headers=["X-Trace-Id", "Server-Timing", "X-Plan-Cache"],
 )
 
+@app.middleware("http")
+async def trace_middleware(request: Request, call_next):
+    """为每个请求分配 trace ID（沿用上游传入的 X-Trace-Id），记录耗时并在响应头中返回"""
+    trace_id = request.headers.get("X-Trace-Id") or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-Id"] = trace_id
+        return response
+    finally:
+        # 用路由模板而不是原始路径作标签，避免标签基数爆炸；流式响应只统计到响应头发出
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, path=path, status=status)
+        trace_id_var.reset(token)
+
 # 全局变量，用于在不同请求间复用
 #MCP 服务进程在整个 API 运行期间只启动一次。所有的用户请求都会复用这个已有的连接
 
+# SSE 心跳间隔(秒)
+SSE_HEARTBEAT_INTERVAL = 15
+
 mcp_manager = {
-    "amap_session": None,
-    "unsplash_session": None, # 👈 新增 Unsplash 会话
+    "amap_pool": None,
+    "unsplash_pool": None,    # 👈 新增 Unsplash 进程池
+    "photo_resolver": None,   # 景点配图解析器（带缓存）
+    "plan_cache": PlanCache(),  # 行程结果缓存
     "master": None,
-    "exit_stack": None
+    "job_queue": None,          # 规划任务队列（限制同时运行的规划数）
+    "startup_seconds": None,
 }
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时：建立两个 MCP 连接"""
-    from contextlib import AsyncExitStack
-    stack = AsyncExitStack()
-    mcp_manager["exit_stack"] = stack
-
-    # --- 连接高德服务 ---
-    amap_params = StdioServerParameters(
-        command="python",
-        args=["services/amap_mcp_service.py"],
-        env={"AMAP_API_KEY": os.getenv("AMAP_API_KEY")}
-    )
-    a_read, a_write = await stack.enter_async_context(stdio_client(amap_params))
-    amap_session = await stack.enter_async_context(ClientSession(a_read, a_write))
-    await amap_session.initialize()
-    mcp_manager["amap_session"] = amap_session
-
-    # --- 💡 新增：连接 Unsplash 服务 ---
-    unsplash_params = StdioServerParameters(
-        command="python",
-        args=["services/unsplash_mcp_service.py"], # 👈 确保文件名和路径正确
-        env={"UNSPLASH_ACCESS_KEY": os.getenv("UNSPLASH_ACCESS_KEY")}
+    """应用启动时：并发启动高德、Unsplash 两个 MCP 进程池，高德就绪后立即初始化专家团"""
+    started = time.perf_counter()
+    health_interval = float(os.getenv("MCP_HEALTH_INTERVAL", "30"))
+
+    async def start_amap():
+        # --- 高德服务进程池 ---
+        amap_params = StdioServerParameters(
+            command="python",
+            args=["services/amap_mcp_service.py"],
+            env={
+                "AMAP_API_KEY": os.getenv("AMAP_API_KEY"),
+                # 路径在父进程中解析为绝对路径：多 worker 部署时所有 worker 的子进程共用同一个 SQLite
+                "AMAP_CACHE_DB": cache_db_path("AMAP_CACHE_DB") or "",
+                "AMAP_CACHE_MAX_ENTRIES": os.getenv("AMAP_CACHE_MAX_ENTRIES", "2048"),
+                "AMAP_FORECAST_UPDATE_HOURS": os.getenv("AMAP_FORECAST_UPDATE_HOURS", "8,11,18"),
+                "AMAP_FORECAST_MAX_ENTRIES": os.getenv("AMAP_FORECAST_MAX_ENTRIES", "1024"),
+                "POI_INDEX_DB": cache_db_path("POI_INDEX_DB") or "",
+                "POI_INDEX_MAX_CELLS": os.getenv("POI_INDEX_MAX_CELLS", "2048"),
+                "POI_INDEX_TTL": os.getenv("POI_INDEX_TTL", str(7 * 24 * 3600)),
+                "AMAP_BASE_URL": os.getenv("AMAP_BASE_URL", "https://restapi.amap.com"),
+            }
+        )
+        amap_pool = MCPServerPool("amap", amap_params, size=int(os.getenv("AMAP_MCP_POOL_SIZE", "2")),
+                                  health_interval=health_interval)
+        await amap_pool.start()
+        mcp_manager["amap_pool"] = amap_pool
+
+        # 初始化 TripMaster (传入高德进程池供 Agent 使用)，工具目录只拉取一次
+        llm = HelloAgentLLM()
+        direct_experts = [k.strip() for k in os.getenv("DIRECT_EXPERTS", "weather_expert,hotel_expert").split(",")
+                          if k.strip()]
+        master = TripMaster(llm, amap_pool, prefetch=os.getenv("PLAN_PREFETCH", "1") == "1",
+                            direct_experts=direct_experts, direct_summary=os.getenv("DIRECT_EXPERT_SUMMARY", "0") == "1")
+        await master.initialize_team()
+        mcp_manager["master"] = master
+
+    async def start_unsplash():
+        # --- 💡 新增：Unsplash 服务进程池 ---
+        unsplash_params = StdioServerParameters(
+            command="python",
+            args=["services/unsplash_mcp_service.py"], # 👈 确保文件名和路径正确
+            env={
+                "UNSPLASH_ACCESS_KEY": os.getenv("UNSPLASH_ACCESS_KEY"),
+                "UNSPLASH_BASE_URL": os.getenv("UNSPLASH_BASE_URL", "https://api.unsplash.com"),
+            }
+        )
+        unsplash_pool = MCPServerPool("unsplash", unsplash_params, size=int(os.getenv("UNSPLASH_MCP_POOL_SIZE", "1")),
+                                      health_interval=health_interval)
+        await unsplash_pool.start()
+        mcp_manager["unsplash_pool"] = unsplash_pool
+        mcp_manager["photo_resolver"] = POIPhotoResolver(unsplash_pool)
+
+    results = await asyncio.gather(start_amap(), start_unsplash(), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        # 任一进程池启动失败：关闭已经启动的另一个，避免留下孤儿 MCP 子进程
+        await _close_pools()
+        raise errors[0]
+
+    # 所有规划（同步、流式、异步任务）都经由同一个有界队列与固定 worker 池执行
+    job_db = cache_db_path("PLAN_JOB_DB")
+    job_queue = PlanJobQueue(
+        run_plan,
+        workers=int(os.getenv("PLAN_WORKERS", "2")),
+        max_queue=int(os.getenv("PLAN_QUEUE_SIZE", "32")),
+        result_ttl=float(os.getenv("PLAN_JOB_TTL", "3600")),
+        # 任务快照只走磁盘（max_entries=0 不保留内存副本），轮询总能读到其他 worker 写入的最新状态
+        store=TTLCache(namespace="plan_jobs", max_entries=0, db_path=job_db) if job_db else None,
     )
-    u_read, u_write = await stack.enter_async_context(stdio_client(unsplash_params))
-    unsplash_session = await stack.enter_async_context(ClientSession(u_read, u_write))
-    await unsplash_session.initialize()
-    mcp_manager["unsplash_session"] = unsplash_session
-
-    # 3. 初始化 TripMaster (传入高德会话供 Agent 使用)
-    llm = HelloAgentLLM()
-    master = TripMaster(llm, amap_session) 
-    await master.initialize_team()
-    mcp_manager["master"] = master
+    await job_queue.start()
+    mcp_manager["job_queue"] = job_queue
+    mcp_manager["startup_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"🚀 服务初始化完成：高德(地图数据) & Unsplash(视觉增强) 已就绪，耗时 {mcp_manager['startup_seconds']}s。")
+
+def _readiness() -> dict:
+    """各组件的就绪状态"""
+    def pool_ready(pool) -> bool:
+        return bool(pool) and any(w.alive for w in pool.workers)
+    return {
+        "amap_mcp": pool_ready(mcp_manager["amap_pool"]),
+        "unsplash_mcp": pool_ready(mcp_manager["unsplash_pool"]),
+        "agents": mcp_manager["master"] is not None,
+        "photo_resolver": mcp_manager["photo_resolver"] is not None,
+        "plan_queue": mcp_manager["job_queue"] is not None and mcp_manager["job_queue"].started,
+    }
+
+@app.get("/healthz")
+async def healthz():
+    """存活探针：进程能处理请求即返回 200"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """就绪探针：MCP 进程池与专家团全部就绪才返回 200，否则 503 并列出未就绪的部分"""
+    components = _readiness()
+    ready = all(components.values())
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "not_ready",
+        "components": components,
+        "startup_seconds": mcp_manager["startup_seconds"],
+        "plan_queue": mcp_manager["job_queue"].stats() if mcp_manager["job_queue"] else None,
+    }
+
+def apply_budget(plan_object: TripPlan) -> TripPlan:
+    """根据行程内容汇总预算，覆盖模型给出的估算值"""
+    # 使用列表推导式优雅地累加各项支出
+    calc_attractions = sum(attr.ticket_price for day in plan_object.days for attr in day.attractions)
+    calc_hotels = sum(day.hotel.estimated_cost for day in plan_object.days if day.hotel)
+    calc_meals = sum(meal.estimated_cost for day in plan_object.days for meal in day.meals)
     
-    print("🚀 服务初始化完成：高德(地图数据) & Unsplash(视觉增强) 已就绪。")
+    # 交通费：根据天数计算固定预估值（或保留模型预估值）
+    calc_transportation = 50.0 * plan_object.travel_days
+
+    # 实例化新的 Budget 对象并赋值给 plan.budget
+    plan_object.budget = Budget(
+        total_attractions=int(calc_attractions),
+        total_hotels=int(calc_hotels),
+        total_meals=int(calc_meals),
+        total_transportation=int(calc_transportation),
+        total=int(calc_attractions + calc_hotels + calc_meals + calc_transportation)
+    )
+    return plan_object
+
+async def run_plan(request: TripRequest, on_event=None):
+    """任务队列的执行函数：多智能体规划 + 预算汇总 + 写入行程缓存"""
+    plan_object, report = await mcp_manager["master"].create_plan_with_report(request, on_event=on_event)
+    # 💡 核心逻辑：利用对象属性进行数学计算，更新对象的 budget 属性
+    apply_budget(plan_object)
+    mcp_manager["plan_cache"].set(request, plan_object)
+    return plan_object, report
+
+def _submit_job(request: TripRequest, on_event=None):
+    """提交规划任务，队列已满时返回 429 并通过 Retry-After 告知预计可重试的时间"""
+    job_queue = mcp_manager["job_queue"]
+    if not mcp_manager["master"] or not job_queue:
+        raise HTTPException(status_code=500, detail="系统尚未初始化完成")
+    try:
+        return job_queue.submit(request, on_event=on_event)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 @app.post("/api/plan")  #高度解耦，它不需要知道MCP存在，也不知道工具有多少
-async def create_plan(request: TripRequest):
+async def create_plan(request: TripRequest, response: Response):
     """
     接收用户旅行需求，调用 TripMaster 进行规划
     """
     master = mcp_manager["master"]
     if not master:
         raise HTTPException(status_code=500, detail="系统尚未初始化完成")
-    
+
+    # 规范化后相同的请求直接返回缓存的行程，省去整条多智能体流水线
+    plan_cache = mcp_manager["plan_cache"]
+    cached_plan = plan_cache.get(request)
+    if cached_plan:
+        response.headers["X-Plan-Cache"] = "HIT"
+        return cached_plan
+    response.headers["X-Plan-Cache"] = "MISS"
+
+    # 同步接口同样经由任务队列执行，只是在这里等待任务完成
+    job = _submit_job(request)
     try:
-       # 直接传递对象，不再传递拼凑的字符串
-        plan_object = await master.create_plan(request)
-        # 2. 💡 核心逻辑：利用对象属性进行数学计算
-        # 使用列表推导式优雅地累加各项支出
-        calc_attractions = sum(attr.ticket_price for day in plan_object.days for attr in day.attractions)
-        calc_hotels = sum(day.hotel.estimated_cost for day in plan_object.days if day.hotel)
-        calc_meals = sum(meal.estimated_cost for day in plan_object.days for meal in day.meals)
-        
-        # 交通费：根据天数计算固定预估值（或保留模型预估值）
-        calc_transportation = 50.0 * plan_object.travel_days
-
-        # 3. 更新对象的 budget 属性
-        # 实例化新的 Budget 对象并赋值给 plan.budget
-        plan_object.budget = Budget(
-            total_attractions=int(calc_attractions),
-            total_hotels=int(calc_hotels),
-            total_meals=int(calc_meals),
-            total_transportation=int(calc_transportation),
-            total=int(calc_attractions + calc_hotels + calc_meals + calc_transportation)
-        )
+        await job.wait()
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+    if job.status != "succeeded":
+        print(f"Plan Error: {job.error}")
+        raise HTTPException(status_code=500, detail=job.error or f"规划任务{job.status}")
+    # 各阶段耗时与关键路径通过 Server-Timing 头返回
+    response.headers["Server-Timing"] = job.report.server_timing()
+    # 直接返回 Pydantic 对象,FastAPI 会自动将其序列化为 JSON
+    return job.result
 
-        # 4. 直接返回 Pydantic 对象,FastAPI 会自动将其序列化为 JSON
-        return plan_object
-            
-    except Exception as e:
-        print(f"Plan Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/api/plans", status_code=202)
+async def submit_plan_job(request: TripRequest, response: Response):
+    """
+    异步任务模式：立即返回任务 ID，客户端轮询 GET /api/plans/{job_id} 获取状态与结果。
+    队列已满时返回 429 + Retry-After。
+    """
+    cached_plan = mcp_manager["plan_cache"].get(request)
+    if cached_plan and mcp_manager["job_queue"]:
+        job = mcp_manager["job_queue"].add_finished(request, cached_plan)
+        response.headers["X-Plan-Cache"] = "HIT"
+    else:
+        job = _submit_job(request)
+        response.headers["X-Plan-Cache"] = "MISS"
+    response.headers["Location"] = f"/api/plans/{job.id}"
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/plans/{job.id}",
+        "queue_position": mcp_manager["job_queue"].position(job),
+    }
+
+@app.get("/api/plans/{job_id}")
+async def get_plan_job(job_id: str, response: Response):
+    """查询规划任务：queued / running / succeeded / failed / cancelled，成功时附带 TripPlan"""
+    job_queue = mcp_manager["job_queue"]
+    job = job_queue.get(job_id) if job_queue else None
+    if not job:
+        # 多 worker 部署时任务可能由其他 worker 执行，从共享存储读取其状态快照
+        snapshot = job_queue.snapshot(job_id) if job_queue else None
+        if not snapshot:
+            raise HTTPException(status_code=404, detail="任务不存在或已过期")
+        if snapshot["status"] in ("queued", "running"):
+            response.headers["Retry-After"] = "2"
+        return snapshot
+    data = job.to_dict()
+    if job.status == "queued":
+        data["queue_position"] = job_queue.position(job)
+        # 提示客户端下一次轮询的合适间隔
+        response.headers["Retry-After"] = str(max(1, min(10, job_queue.retry_after() // 4)))
+    if job.report is not None:
+        response.headers["Server-Timing"] = job.report.server_timing()
+    return data
+
+def _sse(event: str, data: Any) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+    if isinstance(data, BaseModel):
+        data = data.model_dump()
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/plan/stream")
+async def create_plan_stream(request: TripRequest, http_request: Request):
+    """
+    流式版本的 /api/plan：以 SSE 推送各阶段开始/完成事件、专家结果和最终 TripPlan。
+    事件类型：queued / stage_start / stage_finish / day / plan / done / error；空闲时发送注释行保活。
+    """
+    master = mcp_manager["master"]
+    if not master:
+        raise HTTPException(status_code=500, detail="系统尚未初始化完成")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    plan_cache = mcp_manager["plan_cache"]
+
+    async def on_event(event: str, stage: str, payload: Any = None):
+        data = {"stage": stage}
+        # 专家的文本结果随 stage_finish 推送；TripPlan 在预算计算后以 plan 事件单独推送
+        if event == "stage_finish" and not isinstance(payload, BaseModel):
+            data["result"] = payload
+        elif event == "day":
+            data["day"] = payload.model_dump()
+        await queue.put((event, data))
+
+    # 未命中缓存时先提交任务，队列已满则在开始推流前直接返回 429
+    cached_plan = plan_cache.get(request)
+    job = None if cached_plan else _submit_job(request, on_event=on_event)
+    if job is not None:
+        # 在 worker 推送阶段事件之前先放入 queued 事件，保证它是第一条
+        queue.put_nowait(("queued", {"job_id": job.id, "queue_position": mcp_manager["job_queue"].position(job)}))
+
+    async def stream_plan():
+        try:
+            if cached_plan:
+                await queue.put(("plan", cached_plan))
+                await queue.put(("done", {"cache": "hit"}))
+                return
+            await job.wait()
+            if job.status != "succeeded":
+                raise RuntimeError(job.error or f"规划任务{job.status}")
+            plan_object, report = job.result, job.report
+            await queue.put(("plan", plan_object))
+            await queue.put(("done", {
+                "cache": "miss",
+                "job_id": job.id,
+                "trace_id": trace_id_var.get(),
+                "critical_path": report.critical_path,
+                "critical_path_time": round(report.critical_path_time, 3),
+                "wall_time": round(report.wall_time, 3),
+                "stages": {n: round(t.duration, 3) for n, t in report.timings.items()},
+            }))
+        except Exception as e:
+            print(f"Plan Stream Error: {e}")
+            await queue.put(("error", {"detail": str(e)}))
+        finally:
+            await queue.put(None)
+
+    async def event_stream():
+        task = asyncio.create_task(stream_plan())
+        try:
+            yield ": stream opened\n\n"  # 立即返回首字节
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await http_request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"  # 心跳，防止代理断开空闲连接
+                    continue
+                if item is None:
+                    break
+                yield _sse(*item)
+        finally:
+            # 客户端断开时取消仍在运行的规划任务
+            if not task.done():
+                task.cancel()
+            if job is not None and not job.finished:
+                job.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/poi/photo")
 async def poi_photo_api(name: str):
     """
     前端异步调用此接口。它不再直接运行函数，而是通过 MCP 协议向 Unsplash 服务发起调用。
     """
-    session = mcp_manager["unsplash_session"]
-    if not session:
+    resolver = mcp_manager["photo_resolver"]
+    if not resolver:
         return {"success": False, "error": "视觉服务未就绪"}
     
     try:
-        # 👈 核心修复：使用 call_tool 按照协议名称调用
-        result = await session.call_tool("get_poi_photo", arguments={"name": name})
-        # MCP 返回的是 content 列表，提取其中的 text (即图片 URL)
-        img_url = result.content[0].text if result.content else ""
-        
+        img_url = await resolver.resolve(name)
         return {
             "success": True,
             "data": { "photo_url": img_url }
@@ -139,16 +405,93 @@ async def poi_photo_api(name: str):
         print(f"Unsplash Call Error: {e}")
         return {"success": False, "error": str(e)}
 
+@app.post("/api/poi/photos")
+async def poi_photos_api(request: POIPhotoBatchRequest):
+    """
+    批量获取景点配图：一次请求解析整份行程的所有景点，名称去重后并发查询，优先命中缓存。
+    """
+    resolver = mcp_manager["photo_resolver"]
+    if not resolver:
+        return {"success": False, "error": "视觉服务未就绪"}
+
+    photos = await resolver.resolve_many(request.names)
+    return {
+        "success": True,
+        "data": { "photos": photos }
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats_api():
+    """查看高德工具结果缓存的命中率，评估节省的配额与延迟"""
+    pool = mcp_manager["amap_pool"]
+    if not pool:
+        return {"success": False, "error": "地图服务未就绪"}
+    try:
+        # 每个子进程各有一份内存缓存，逐个查询后返回
+        stats = []
+        for worker in pool.workers:
+            if worker.alive:
+                result = await worker.session.call_tool("amap_cache_stats", arguments={})
+                if result.content:
+                    stats.append(json.loads(result.content[0].text))
+        data = {"amap_tools": stats, "amap_pool": pool.stats()}
+        if mcp_manager["photo_resolver"]:
+            data["poi_photos"] = mcp_manager["photo_resolver"].cache.stats()
+        data["trip_plans"] = mcp_manager["plan_cache"].stats()
+        return {"success": True, "data": data}
+    except Exception as e:
+        print(f"Cache Stats Error: {e}")
+        return {"success": False, "error": str(e)}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标：阶段、LLM 调用、工具调用、结构化解析耗时直方图与 token 计数"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时：释放 MCP 连接资源"""
-    stack = mcp_manager["exit_stack"]
-    if stack:
-        await stack.aclose()
-    print("👋 系统已安全关闭，资源已释放。")
+    # 先停止规划任务队列，避免仍在运行的任务使用已关闭的进程池
+    job_queue = mcp_manager["job_queue"]
+    if job_queue:
+        mcp_manager["job_queue"] = None
+        await job_queue.close()
+        if job_queue.store:
+            job_queue.store.close()
+    await _close_pools()
+    # 释放 LLM 共享连接池
+    await close_shared_http_client()
+    # 关闭缓存的 SQLite 连接（WAL 模式下最后一个连接关闭时会合并日志文件）
+    mcp_manager["plan_cache"].cache.close()
+    if mcp_manager["photo_resolver"]:
+        mcp_manager["photo_resolver"].cache.close()
+    print(f"👋 worker {os.getpid()} 已安全关闭，资源已释放。")
+
+async def _close_pools():
+    """关闭本 worker 的 MCP 进程池；可重复调用"""
+    for key in ("amap_pool", "unsplash_pool"):
+        pool = mcp_manager[key]
+        if pool:
+            mcp_manager[key] = None
+            await pool.close()
 
     
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="智能旅行规划助手 API")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")),
+                        help="worker 进程数；大于 1 时各 worker 通过共享的 SQLite 缓存复用结果")
+    args = parser.parse_args()
+    if args.workers > 1:
+        if not os.getenv("CACHE_DB"):
+            # 未指定时使用 app 目录下的共享缓存文件；环境变量会被 worker 进程继承
+            os.environ["CACHE_DB"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "travel_cache.sqlite3")
+        print(f"🧩 多 worker 模式：{args.workers} 个 worker，共享缓存 {os.environ['CACHE_DB']}")
+        # 多进程模式下 uvicorn 需要以导入字符串的形式加载应用
+        uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
@@ -0,0 +1,200 @@
+#-----------压测用的本地 OpenAI 兼容 LLM------------#
+# 专家 Agent（带 tools）第一轮返回一个固定的工具调用，拿到工具结果后返回文字总结；
+# 规划专家（system 消息带“输出格式”）返回由 prompt 中城市、日期、候选景点拼出的 TripPlan JSON。
+# 模拟服务端前缀缓存：相同的工具说明 + system 消息再次出现时计入 cached_tokens，且不产生预填充延迟。
+# 用法（在 app 目录）：python -m bench.fake_llm --port 9100 --latency 0.5 --error-rate 0.01
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from datetime import date, timedelta
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LLM")
+settings = {"latency": 0.5, "jitter": 0.2, "error_rate": 0.0, "chunk_delay": 0.01, "prefill_per_1k": 0.05}
+_prefix_cache: "OrderedDict[str, int]" = OrderedDict()  # 前缀哈希 -> token 数
+PREFIX_CACHE_SIZE = 256
+
+# 按参数名填充工具调用参数
+CANNED_ARGS = {
+    "city": "杭州",
+    "keywords": "景点",
+    "keyword": "酒店",
+    "location": "120.1551,30.2741",
+    "origin": "120.1551,30.2741",
+    "destination": "120.1485,30.2420",
+    "locations": "120.1551,30.2741|120.1485,30.2420|120.1019,30.2403",
+    "poi_id": "B000A7BD6C",
+    "name": "西湖",
+}
+DEFAULT_ATTRACTIONS = [
+    ("西湖", "杭州市西湖区龙井路1号", 120.1485, 30.2420),
+    ("灵隐寺", "杭州市西湖区法云弄1号", 120.1019, 30.2403),
+    ("雷峰塔", "杭州市西湖区南山路15号", 120.1488, 30.2311),
+    ("西溪湿地", "杭州市西湖区天目山路518号", 120.0633, 30.2730),
+    ("河坊街", "杭州市上城区河坊街", 120.1694, 30.2425),
+    ("浙江省博物馆", "杭州市西湖区孤山路25号", 120.1430, 30.2540),
+]
+
+
+def _tool_arguments(tool: dict) -> dict:
+    params = tool.get("function", {}).get("parameters", {})
+    return {name: CANNED_ARGS.get(name, "测试") for name in params.get("required", [])}
+
+
+def _last_user_content(messages: list) -> str:
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            return m.get("content") or ""
+    return ""
+
+
+def _build_trip_plan(prompt: str) -> dict:
+    """从规划 prompt 中提取城市、日期、天数与候选景点，拼出一份合法的 TripPlan"""
+    city = (re.search(r"目的地:\s*(\S+)", prompt) or [None, "杭州"])[1]
+    dates = re.search(r"日期:\s*(\S+)\s*至\s*(\S+)\s*\((\d+)天\)", prompt)
+    start, end, days = (dates.group(1), dates.group(2), int(dates.group(3))) if dates else ("2025-06-01", "2025-06-03", 3)
+    candidates = [
+        (m.group(1).strip(), m.group(2).strip(), float(m.group(3)), float(m.group(4)))
+        for m in re.finditer(r"-\s*([^|\n]+)\|\s*([^|\n]+)\|\s*(-?\d+\.\d+),(-?\d+\.\d+)", prompt)
+    ] or DEFAULT_ATTRACTIONS
+    try:
+        first = date.fromisoformat(start)
+    except ValueError:
+        first = date(2025, 6, 1)
+
+    plan_days, weather = [], []
+    for i in range(days):
+        day = (first + timedelta(days=i)).isoformat()
+        picks = [candidates[(i * 2 + k) % len(candidates)] for k in range(2)]
+        plan_days.append({
+            "date": day,
+            "day_index": i + 1,
+            "description": f"第{i + 1}天游览{'、'.join(p[0] for p in picks)}",
+            "weather": "晴",
+            "transportation": "公共交通",
+            "accommodation": "经济型酒店",
+            "hotel": {"name": f"{city}测试酒店", "address": "测试路1号", "estimated_cost": 300,
+                      "location": {"longitude": picks[0][2], "latitude": picks[0][3]}},
+            "attractions": [
+                {"name": n, "address": a, "location": {"longitude": lon, "latitude": lat},
+                 "visit_duration": 120, "description": f"{n}简介", "ticket_price": 40}
+                for n, a, lon, lat in picks
+            ],
+            "meals": [{"type": t, "name": f"{city}{t}餐厅", "estimated_cost": 50} for t in ("早餐", "午餐", "晚餐")],
+        })
+        weather.append({"date": day, "day_weather": "晴", "night_weather": "多云", "day_temp": 26, "night_temp": 18})
+    return {"city": city, "start_date": start, "end_date": end, "travel_days": days, "days": plan_days,
+            "weather_info": weather, "overall_suggestions": "天气晴好，注意防晒。"}
+
+
+def _reply(body: dict) -> dict:
+    """根据请求内容决定返回工具调用还是文本，返回 OpenAI message 字典"""
+    messages = body.get("messages", [])
+    tools = body.get("tools") or []
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    tool_results = [m.get("content") or "" for m in messages[last_user + 1:] if m.get("role") == "tool"]
+
+    if tools and not tool_results:
+        tool = tools[0]
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": tool["function"]["name"],
+                         "arguments": json.dumps(_tool_arguments(tool), ensure_ascii=False)},
+        }]}
+    prompt = _last_user_content(messages)
+    if any(m.get("role") == "system" and "## 输出格式" in (m.get("content") or "") for m in messages):
+        return {"role": "assistant", "content": json.dumps(_build_trip_plan(prompt), ensure_ascii=False)}
+    summary = "\n".join(tool_results) or "暂无数据"
+    return {"role": "assistant", "content": f"根据查询结果整理如下：\n{summary}"}
+
+
+def _cached_prefix_tokens(body: dict) -> int:
+    """工具说明与开头的 system 消息构成固定前缀；见过同一前缀时返回其 token 数"""
+    messages = body.get("messages", [])
+    system = (messages[0].get("content") or "") if messages and messages[0].get("role") == "system" else ""
+    prefix = json.dumps(body.get("tools") or [], ensure_ascii=False) + system
+    key = hashlib.md5(prefix.encode("utf-8")).hexdigest()
+    cached = key in _prefix_cache
+    _prefix_cache[key] = len(prefix) // 2
+    _prefix_cache.move_to_end(key)
+    while len(_prefix_cache) > PREFIX_CACHE_SIZE:
+        _prefix_cache.popitem(last=False)
+    return _prefix_cache[key] if cached else 0
+
+
+def _usage(body: dict, message: dict, cached: int) -> dict:
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    prompt_chars += len(json.dumps(body.get("tools") or [], ensure_ascii=False))
+    completion_chars = len(message.get("content") or "") + len(json.dumps(message.get("tool_calls") or []))
+    return {"prompt_tokens": prompt_chars // 2, "completion_tokens": completion_chars // 2,
+            "total_tokens": (prompt_chars + completion_chars) // 2,
+            "prompt_tokens_details": {"cached_tokens": cached}}
+
+
+async def _simulate_latency(uncached_tokens: int = 0):
+    prefill = settings["prefill_per_1k"] * uncached_tokens / 1000
+    await asyncio.sleep(max(0.0, settings["latency"] + prefill + random.uniform(-1, 1) * settings["jitter"]))
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    message = _reply(body)
+    usage = _usage(body, message, _cached_prefix_tokens(body))
+    # 未命中缓存的 prompt token 需要预填充，按 token 数增加首 token 延迟
+    await _simulate_latency(usage["prompt_tokens"] - usage["prompt_tokens_details"]["cached_tokens"])
+    if random.random() < settings["error_rate"]:
+        return JSONResponse(status_code=500, content={"error": {"message": "fake upstream error", "type": "server_error"}})
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+    created = int(time.time())
+    model = body.get("model", "fake-model")
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": usage,
+        }
+
+    async def events():
+        content = message.get("content") or ""
+        for i in range(0, len(content), 64):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + 64]}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(settings["chunk_delay"])
+        done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="压测用的本地 OpenAI 兼容 LLM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="每次调用的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的随机抖动幅度（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--prefill-per-1k", type=float, default=0.05,
+                        help="每 1000 个未命中前缀缓存的 prompt token 增加的首 token 延迟（秒）")
+    args = parser.parse_args()
+    settings.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    prefill_per_1k=args.prefill_per_1k)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
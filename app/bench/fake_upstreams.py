@@ -0,0 +1,153 @@
+#-----------压测用的本地高德 / Unsplash 模拟服务------------#
+# 按高德 Web 服务与 Unsplash 搜图接口的响应格式返回确定性的假数据，可配置延迟与错误率。
+# 用法（在 app 目录）：
+#   python -m bench.fake_upstreams --service amap --port 9101 --latency 0.05 --error-rate 0.01
+#   python -m bench.fake_upstreams --service unsplash --port 9102
+import math
+import random
+import asyncio
+import hashlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+settings = {"latency": 0.05, "jitter": 0.02, "error_rate": 0.0}
+CITY_CENTER = (120.1551, 30.2741)  # 所有城市都围绕同一中心生成 POI
+
+
+def _seed(*parts) -> random.Random:
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:8], 16))
+
+
+def _fake_pois(keywords: str, count: int, center=CITY_CENTER, spread: float = 0.05) -> list:
+    """同一关键词总是得到同一批 POI，便于缓存命中率与真实情况接近"""
+    rng = _seed(keywords)
+    pois = []
+    for i in range(count):
+        lon = center[0] + rng.uniform(-spread, spread)
+        lat = center[1] + rng.uniform(-spread, spread)
+        pois.append({
+            "id": f"B{hashlib.md5(f'{keywords}{i}'.encode()).hexdigest()[:10].upper()}",
+            "name": f"{keywords}{i + 1}",
+            "type": "风景名胜;风景名胜" if "酒店" not in keywords else "住宿服务;宾馆酒店",
+            "address": f"测试路{i + 1}号",
+            "location": f"{lon:.6f},{lat:.6f}",
+            "tel": "0571-00000000",
+            "biz_ext": {"rating": f"{rng.uniform(3.5, 5):.1f}", "cost": str(rng.randint(50, 800))},
+        })
+    return pois
+
+
+def _distance_m(a: str, b: str) -> int:
+    (lon1, lat1), (lon2, lat2) = ([float(x) for x in p.split(",")] for p in (a, b))
+    dx = (lon2 - lon1) * 111_320 * math.cos(math.radians((lat1 + lat2) / 2))
+    dy = (lat2 - lat1) * 111_320
+    return int(math.hypot(dx, dy))
+
+
+def _apply_chaos(app: FastAPI):
+    """为所有接口加上模拟延迟与随机 500 错误"""
+    @app.middleware("http")
+    async def chaos(request: Request, call_next):
+        await asyncio.sleep(max(0.0, settings["latency"] + random.uniform(-1, 1) * settings["jitter"]))
+        if random.random() < settings["error_rate"]:
+            return JSONResponse(status_code=500, content={"info": "fake upstream error"})
+        return await call_next(request)
+
+
+# ============ 高德 ============
+amap_app = FastAPI(title="Fake Amap")
+_apply_chaos(amap_app)
+
+
+@amap_app.get("/v3/place/text")
+async def place_text(keywords: str = "景点", offset: int = 20):
+    pois = _fake_pois(keywords, offset)
+    return {"status": "1", "info": "OK", "count": str(len(pois)), "pois": pois}
+
+
+@amap_app.get("/v3/place/around")
+async def place_around(location: str, keywords: str = "", radius: int = 3000, offset: int = 20):
+    center = tuple(float(x) for x in location.split(","))
+    pois = []
+    for p in _fake_pois(keywords or "周边", 50, center=center, spread=radius / 111_320):
+        d = _distance_m(location, p["location"])
+        if d <= radius:
+            pois.append(dict(p, distance=str(d)))
+    pois.sort(key=lambda p: int(p["distance"]))
+    return {"status": "1", "info": "OK", "count": str(len(pois)), "pois": pois[:offset]}
+
+
+@amap_app.get("/v3/place/detail")
+async def place_detail(id: str):
+    poi = _fake_pois(id, 1)[0]
+    return {"status": "1", "info": "OK", "pois": [dict(poi, id=id)]}
+
+
+@amap_app.get("/v3/weather/weatherInfo")
+async def weather(city: str, extensions: str = "base"):
+    if extensions == "all":
+        today = datetime.now(timezone(timedelta(hours=8))).date()
+        casts = [{"date": (today + timedelta(days=i)).isoformat(), "week": str((today + timedelta(days=i)).isoweekday()),
+                  "dayweather": ("晴", "多云", "小雨", "阴")[i % 4], "nightweather": "多云",
+                  "daytemp": str(28 - i), "nighttemp": str(19 - i), "daywind": "东南", "nightwind": "东南",
+                  "daypower": "1-3", "nightpower": "1-3"} for i in range(4)]
+        return {"status": "1", "info": "OK", "forecasts": [{"city": city, "adcode": city, "casts": casts}]}
+    return {"status": "1", "info": "OK", "lives": [{
+        "city": city, "weather": "晴", "temperature": "26", "winddirection": "东南",
+        "windpower": "≤3", "humidity": "60",
+    }]}
+
+
+@amap_app.get("/v3/direction/{mode}")
+async def direction(mode: str, origin: str, destination: str):
+    d = _distance_m(origin, destination)
+    return {"status": "1", "info": "OK", "route": {"paths": [{"distance": str(d), "duration": str(d // 8)}]}}
+
+
+@amap_app.get("/v4/direction/bicycling")
+async def bicycling(origin: str, destination: str):
+    d = _distance_m(origin, destination)
+    return {"errcode": 0, "data": {"paths": [{"distance": d, "duration": d // 4}]}}
+
+
+@amap_app.get("/v3/distance")
+async def distance(origins: str, destination: str, type: int = 1):
+    results = [
+        {"origin_id": str(i + 1), "dest_id": "1", "distance": str(_distance_m(o, destination)),
+         "duration": str(_distance_m(o, destination) // 8)}
+        for i, o in enumerate(origins.split("|"))
+    ]
+    return {"status": "1", "info": "OK", "results": results}
+
+
+# ============ Unsplash ============
+unsplash_app = FastAPI(title="Fake Unsplash")
+_apply_chaos(unsplash_app)
+
+
+@unsplash_app.get("/search/photos")
+async def search_photos(query: str, per_page: int = 1):
+    digest = hashlib.md5(query.encode("utf-8")).hexdigest()[:12]
+    return {"total": 1, "results": [{"id": digest, "urls": {"regular": f"https://images.example.com/{digest}.jpg"}}]}
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="压测用的本地高德 / Unsplash 模拟服务")
+    parser.add_argument("--service", choices=["amap", "unsplash"], required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--latency", type=float, default=0.05, help="每次请求的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="延迟的随机抖动幅度（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    args = parser.parse_args()
+    settings.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    app = amap_app if args.service == "amap" else unsplash_app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#-----------压测负载生成器------------#
+# 以固定并发（闭环：每个 worker 收到响应后立即发下一个请求）压测 /api/plan 与 /api/poi/photo，
+# 输出各并发档位的 p50/p95/p99 延迟与吞吐量 JSON，可用 --compare 与上一次的基线对比。
+# 用法（在 app 目录，后端已启动）：
+#   python -m bench.load_test --concurrency 1,4,16 --requests 32 --output bench_baseline.json
+#   python -m bench.load_test --compare bench_baseline.json --output bench_new.json
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List
+import httpx
+
+CITIES = ["杭州", "北京", "上海", "成都", "西安", "广州", "南京", "苏州"]
+PREFERENCES = [["历史文化"], ["美食"], ["自然风光"], ["历史文化", "美食"], ["博物馆", "购物"]]
+POI_NAMES = ["西湖", "灵隐寺", "雷峰塔", "故宫", "天坛", "颐和园", "外滩", "东方明珠", "宽窄巷子", "大雁塔",
+             "兵马俑", "广州塔", "中山陵", "夫子庙", "拙政园", "虎丘", "西溪湿地", "河坊街", "鼓浪屿", "黄鹤楼"]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """线性插值百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict:
+    values = sorted(latencies)
+    total = len(values) + errors
+    return {
+        "requests": total,
+        "ok": len(values),
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+        "throughput_rps": round(len(values) / wall, 3) if wall > 0 else 0.0,
+        "wall_seconds": round(wall, 3),
+    }
+
+
+def plan_request(i: int, cache_bust: bool) -> Dict:
+    days = 2 + i % 3
+    body = {
+        "city": CITIES[i % len(CITIES)],
+        "start_date": "2025-06-01",
+        "end_date": f"2025-06-{days:02d}",
+        "travel_days": days,
+        "transportation": "公共交通",
+        "accommodation": "经济型酒店",
+        "preferences": PREFERENCES[i % len(PREFERENCES)],
+        "free_text_input": "",
+    }
+    if cache_bust:
+        # 额外要求只参与缓存键，不影响规划流程，用来避免命中行程缓存
+        body["free_text_input"] = f"bench-{uuid.uuid4().hex[:8]}"
+    return body
+
+
+async def run_level(client: httpx.AsyncClient, make_call: Callable, concurrency: int, total: int) -> Dict:
+    """闭环压测一个并发档位：concurrency 个 worker 共同完成 total 个请求"""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                resp = await make_call(client, i)
+                ok = resp.status_code == 200 and resp.json().get("success", True)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+async def run_benchmark(base_url: str, endpoints: List[str], levels: List[int], requests: int,
+                        cache_bust: bool, timeout: float) -> Dict:
+    calls = {
+        "plan": lambda client, i: client.post("/api/plan", json=plan_request(i, cache_bust)),
+        "photo": lambda client, i: client.get("/api/poi/photo", params={
+            "name": f"{POI_NAMES[i % len(POI_NAMES)]} {uuid.uuid4().hex[:6]}" if cache_bust
+            else POI_NAMES[i % len(POI_NAMES)]}),
+    }
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "base_url": base_url,
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "requests_per_level": requests,
+            "cache_bust": cache_bust,
+        },
+        "results": {},
+    }
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for endpoint in endpoints:
+            report["results"][endpoint] = {}
+            for level in levels:
+                print(f"🚦 {endpoint} 并发 {level}，共 {requests} 个请求...")
+                stats = await run_level(client, calls[endpoint], level, requests)
+                report["results"][endpoint][str(level)] = stats
+                print(f"   p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms "
+                      f"吞吐={stats['throughput_rps']}/s 错误={stats['errors']}")
+    return report
+
+
+def compare(old: Dict, new: Dict) -> List[str]:
+    """逐项对比两份基线，返回可读的变化行（延迟为负、吞吐为正表示变好）"""
+    lines = []
+    for endpoint, levels in new["results"].items():
+        for level, stats in levels.items():
+            base = old.get("results", {}).get(endpoint, {}).get(level)
+            if not base:
+                continue
+            parts = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "error_rate"):
+                before, after = base.get(key, 0), stats.get(key, 0)
+                change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+                parts.append(f"{key} {before} -> {after} ({change})")
+            lines.append(f"{endpoint} @{level}: " + ", ".join(parts))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI Travel Agent 压测负载生成器")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoints", default="plan,photo", help="逗号分隔：plan, photo")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发档位")
+    parser.add_argument("--requests", type=int, default=32, help="每个并发档位的请求数")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--no-cache-bust", action="store_true", help="不打散请求参数，允许命中行程/配图缓存")
+    parser.add_argument("--output", default="bench_baseline.json")
+    parser.add_argument("--compare", help="与之对比的旧基线 JSON 文件")
+    args = parser.parse_args(argv)
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    endpoints = [x.strip() for x in args.endpoints.split(",") if x.strip()]
+    report = asyncio.run(run_benchmark(args.base_url, endpoints, levels, args.requests,
+                                       not args.no_cache_bust, args.timeout))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 基线已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        print(f"📊 与 {args.compare} 对比：")
+        for line in compare(old, report) or ["（两份基线没有相同的接口与并发档位）"]:
+            print("   " + line)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+#-----------一键离线压测------------#
+# 启动本地模拟 LLM / 高德 / Unsplash 与后端服务（全部指向模拟服务，不消耗真实配额），
+# 等待 /readyz 就绪后运行负载生成器，结束时关闭所有子进程。
+# 用法（在 app 目录）：
+#   python -m bench.run_bench --llm-latency 0.3 --upstream-latency 0.05 --concurrency 1,4,16 --requests 32
+#   其余参数（--endpoints / --output / --compare 等）原样传给 bench.load_test
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import httpx
+from bench import load_test
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"等待 {url} 就绪超时")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动模拟依赖与后端后运行压测")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-latency", type=float, default=0.05)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    args, load_args = parser.parse_known_args()
+
+    ports = {name: free_port() for name in ("llm", "amap", "unsplash", "api")}
+    env = dict(
+        os.environ,
+        LLM_BASE_URL=f"http://127.0.0.1:{ports['llm']}/v1",
+        LLM_API_KEY="bench",
+        LLM_MODEL_ID="fake-model",
+        AMAP_API_KEY="bench",
+        AMAP_BASE_URL=f"http://127.0.0.1:{ports['amap']}",
+        UNSPLASH_ACCESS_KEY="bench",
+        UNSPLASH_BASE_URL=f"http://127.0.0.1:{ports['unsplash']}",
+    )
+    commands = [
+        [sys.executable, "-m", "bench.fake_llm", "--port", str(ports["llm"]),
+         "--latency", str(args.llm_latency), "--error-rate", str(args.llm_error_rate)],
+        [sys.executable, "-m", "bench.fake_upstreams", "--service", "amap", "--port", str(ports["amap"]),
+         "--latency", str(args.upstream_latency), "--error-rate", str(args.upstream_error_rate)],
+        [sys.executable, "-m", "bench.fake_upstreams", "--service", "unsplash", "--port", str(ports["unsplash"]),
+         "--latency", str(args.upstream_latency), "--error-rate", str(args.upstream_error_rate)],
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(ports["api"]), "--log-level", "warning"],
+    ]
+    processes = []
+    try:
+        for cmd in commands:
+            processes.append(subprocess.Popen(cmd, cwd=APP_DIR, env=env))
+        base_url = f"http://127.0.0.1:{ports['api']}"
+        print(f"⏳ 等待后端就绪：{base_url}")
+        wait_ready(f"{base_url}/readyz", args.startup_timeout)
+        load_test.main(["--base-url", base_url] + load_args)
+    finally:
+        for p in reversed(processes):
+            p.terminate()
+        for p in processes:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#-----------行程结果缓存------------#
+import os
+import json
+import hashlib
+from typing import Optional
+from cache.ttl_cache import TTLCache, cache_db_path
+from models.schemas import TripRequest, TripPlan
+
+
+def _norm(text: Optional[str]) -> str:
+    """去首尾空白、合并连续空白并统一大小写"""
+    return " ".join((text or "").split()).casefold()
+
+
+def plan_cache_key(request: TripRequest) -> str:
+    """
+    TripRequest 的规范化键：偏好去重排序，文本统一大小写与空白，
+    free_text_input 只参与哈希，使仅有空白或顺序差异的请求命中同一条缓存。
+    """
+    canonical = {
+        "city": _norm(request.city),
+        "start_date": request.start_date.strip(),
+        "end_date": request.end_date.strip(),
+        "travel_days": request.travel_days,
+        "transportation": _norm(request.transportation),
+        "accommodation": _norm(request.accommodation),
+        "preferences": sorted({_norm(p) for p in request.preferences if _norm(p)}),
+        "free_text": hashlib.sha256(_norm(request.free_text_input).encode("utf-8")).hexdigest(),
+    }
+    digest = hashlib.sha256(json.dumps(canonical, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return f"plan:{digest.hexdigest()}"
+
+
+class PlanCache:
+    """TripRequest -> TripPlan 缓存；ttl<=0 时禁用"""
+    def __init__(self, ttl: float = None, max_entries: int = None, db_path: Optional[str] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("PLAN_CACHE_TTL", str(6 * 3600)))
+        self.cache = TTLCache(
+            namespace="trip_plans",
+            max_entries=max_entries or int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "256")),
+            default_ttl=self.ttl,
+            db_path=db_path or cache_db_path("PLAN_CACHE_DB"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, request: TripRequest) -> Optional[TripPlan]:
+        if not self.enabled:
+            return None
+        data = self.cache.get(plan_cache_key(request))
+        # 每次返回新对象，避免调用方修改缓存内容
+        return TripPlan.model_validate(data) if data is not None else None
+
+    def set(self, request: TripRequest, plan: TripPlan):
+        if self.enabled:
+            self.cache.set(plan_cache_key(request), plan.model_dump(), self.ttl)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,185 @@
+#-----------带 TTL 的 LRU 缓存（可选 SQLite 持久化）------------#
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 区分“未命中”与“缓存了 None”
+MISSING = object()
+
+# 多进程同时写同一个 SQLite 文件时，等待写锁的最长时间（秒）
+SQLITE_BUSY_TIMEOUT = float(os.getenv("CACHE_DB_BUSY_TIMEOUT", "5"))
+
+
+def cache_db_path(env_name: str) -> Optional[str]:
+    """
+    解析缓存的 SQLite 路径：专用变量（如 PLAN_CACHE_DB）优先，其次是所有缓存共用的 CACHE_DB。
+    返回绝对路径，使 API worker 与 MCP 子进程无论工作目录如何都指向同一个文件；未配置时返回 None。
+    """
+    path = os.getenv(env_name) or os.getenv("CACHE_DB")
+    return os.path.abspath(path) if path else None
+
+
+def open_sqlite(db_path: str) -> sqlite3.Connection:
+    """
+    打开可被多个进程共享的 SQLite 连接：WAL 模式下读写互不阻塞，
+    写锁冲突时等待 busy_timeout 而不是立即报 database is locked。
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute(f"PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")  # WAL 下足够安全，且每次提交不必 fsync
+    return conn
+
+
+def make_cache_key(name: str, arguments: Dict[str, Any]) -> str:
+    """工具名 + 规范化参数 -> 缓存键：字符串去首尾空白并转小写，键排序"""
+    def normalize(v):
+        if isinstance(v, str):
+            return " ".join(v.split()).lower()
+        if isinstance(v, (list, tuple)):
+            return [normalize(x) for x in v]
+        if isinstance(v, dict):
+            return {k: normalize(x) for k, x in v.items()}
+        return v
+    args = {k: normalize(v) for k, v in arguments.items()}
+    return f"{name}:{json.dumps(args, ensure_ascii=False, sort_keys=True)}"
+
+
+class TTLCache:
+    """
+    内存 LRU + 过期时间；传入 db_path 时额外写入 SQLite，进程重启后仍可命中。
+    值需可 JSON 序列化。内存未命中时会回查磁盘并回填内存。
+    多个进程（如多 worker 部署）指向同一个 db_path 时共享磁盘层：任一进程写入的条目，
+    其他进程在内存未命中时即可读到。磁盘读写失败只记日志，不影响调用方。
+    """
+    def __init__(self, namespace: str = "default", max_entries: int = 1024,
+                 default_ttl: float = 3600, db_path: Optional[str] = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.disk_errors = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = open_sqlite(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+
+            value = self._disk_get(key, now)
+            if value is not MISSING:
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._memory_set(key, value, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                        (self.namespace, key, json.dumps(value, ensure_ascii=False), expires_at),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._disk_failed("写入", e)
+
+    def _memory_set(self, key: str, value: Any, expires_at: float):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)  # 淘汰最久未使用的条目
+            self.evictions += 1
+
+    def _disk_get(self, key: str, now: float) -> Any:
+        if self._db is None:
+            return MISSING
+        try:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                self._db.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._db.commit()
+                row = None
+        except sqlite3.Error as e:
+            self._disk_failed("读取", e)
+            return MISSING
+        if row is None:
+            return MISSING
+        value = json.loads(row[0])
+        self._memory_set(key, value, row[1])
+        return value
+
+    def _disk_failed(self, action: str, error: Exception):
+        self.disk_errors += 1
+        logger.warning(f"缓存 {self.namespace} 磁盘{action}失败: {error}")
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def disk_entries(self) -> Optional[int]:
+        """磁盘层（所有进程共享）中未过期的条目数"""
+        if self._db is None:
+            return None
+        with self._lock:
+            try:
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+                    (self.namespace, time.time()),
+                ).fetchone()[0]
+            except sqlite3.Error:
+                return None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+            "disk_entries": self.disk_entries(),
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "persistent": self._db is not None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,95 @@
+#-----------ReAct 上下文 token 预算管理------------#
+# 统计每条消息的 token 数，超出预算时从最早的工具结果开始压缩，
+# 最近一轮的工具结果、system 与 user 消息始终保留原文。
+import re
+import json
+from typing import Dict, List, Optional
+
+try:  # tiktoken 为可选依赖，未安装时使用字符数估算
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+MESSAGE_OVERHEAD = 4  # 每条消息的角色、分隔符等固定开销
+
+
+def count_tokens(text: str) -> int:
+    """估算文本 token 数：有 tiktoken 时精确计算，否则中文按 1 字 1 token、其他字符按 4 字符 1 token"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    tokens = MESSAGE_OVERHEAD + count_tokens(message.get("content") or "")
+    if message.get("tool_calls"):
+        tokens += count_tokens(json.dumps(message["tool_calls"], ensure_ascii=False))
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """把文本截断到约 max_tokens 个 token，按行保留开头部分"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for line in text.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if not kept:  # 单行过长时按字符截断
+        kept.append(text[:max_tokens])
+    return "\n".join(kept) + f"\n…（已截断，原文约 {count_tokens(text)} tokens）"
+
+
+class ContextBudget:
+    """
+    单次 Agent 运行的上下文预算。每次调用 LLM 前执行 fit(messages)：
+    总量超过 max_tokens 时，把较早的 tool 消息压缩为前 compact_tokens 个 token 的摘录。
+    """
+    def __init__(self, max_tokens: int = 6000, compact_tokens: int = 150):
+        self.max_tokens = max_tokens
+        self.compact_tokens = compact_tokens
+        self._saved: Dict[int, int] = {}  # 消息下标 -> 压缩节省的 token 数
+
+    def total_tokens(self, messages: List[Dict]) -> int:
+        return sum(message_tokens(m) for m in messages)
+
+    def fit(self, messages: List[Dict]) -> int:
+        """按预算压缩 messages（原地修改），返回本次请求因压缩而少发送的 token 数"""
+        total = self.total_tokens(messages)
+        if total > self.max_tokens:
+            # 最后一条 assistant 之后的工具结果是模型马上要用的，不压缩
+            last_assistant = max((i for i, m in enumerate(messages) if m["role"] == "assistant"), default=-1)
+            for i, m in enumerate(messages):
+                if total <= self.max_tokens:
+                    break
+                if m["role"] != "tool" or i > last_assistant or i in self._saved:
+                    continue
+                before = message_tokens(m)
+                m["content"] = truncate_to_tokens(m["content"], self.compact_tokens)
+                saved = before - message_tokens(m)
+                self._saved[i] = saved
+                total -= saved
+        return sum(self._saved.values())
+
+    @property
+    def compacted_messages(self) -> int:
+        return len(self._saved)
+
+
+def budget_sections(sections: Dict[str, str], max_tokens: Optional[int]) -> Dict[str, str]:
+    """把多段文本（如各专家输出）按比例截断到总预算内"""
+    if not max_tokens:
+        return sections
+    sizes = {k: count_tokens(v) for k, v in sections.items()}
+    total = sum(sizes.values())
+    if total <= max_tokens:
+        return sections
+    return {k: truncate_to_tokens(v, max(1, max_tokens * sizes[k] // total)) for k, v in sections.items()}
@@ -0,0 +1,66 @@
+#-----------直连工具的专家------------#
+# 天气、酒店这类专家的工作本质上是一次（或一组）确定的工具调用：参数可以直接从 TripRequest 推出，
+# 走完整的 ReAct 循环只是让 LLM 先决定调用什么、再复述一遍结果（至少两轮 LLM 往返）。
+# DirectExpert 按 team_config 中声明的调用直接执行工具，用模板拼接结果，可选再做一次 LLM 总结。
+import asyncio
+from typing import Callable, List, Optional, Tuple
+from SimpleAgent import SimpleAgent
+from llm_client import ToolCall, FunctionCall
+from models.schemas import TripRequest
+from prefetch import weather_args, hotel_args
+
+# (工具名, 参数) 列表
+ToolCalls = List[Tuple[str, dict]]
+
+
+def weather_calls(request: TripRequest, **_) -> ToolCalls:
+    return [("amap_maps_weather", weather_args(request))]
+
+
+def hotel_calls(request: TripRequest, center: Optional[str] = None, **_) -> ToolCalls:
+    """按住宿类型在全城搜索（与预取的调用参数一致），有景点中心坐标时再搜索其周边的酒店"""
+    calls = [("amap_hotel_search", hotel_args(request))]
+    if center:
+        calls.append(("search_nearby", {"location": center, "keyword": "酒店"}))
+    return calls
+
+
+def format_observations(results: List[Tuple[str, str]]) -> str:
+    """默认模板：按调用顺序列出每个工具的返回文本"""
+    return "\n\n".join(f"【{name}】\n{text}" for name, text in results)
+
+
+class DirectExpert(SimpleAgent):
+    """不经 LLM 决策、直接调用固定工具的专家；工具的并发限制、超时与异常处理沿用 SimpleAgent"""
+    def __init__(self, name: str, llm, system_prompt: Optional[str] = None,
+                 calls: Callable[..., ToolCalls] = None,
+                 template: Callable[[List[Tuple[str, str]]], str] = format_observations,
+                 summarize: bool = False, **kwargs):
+        super().__init__(name=name, llm=llm, system_prompt=system_prompt, **kwargs)
+        self.calls = calls
+        self.template = template
+        self.summarize = summarize  # True 时用一次不带工具的 LLM 调用把工具结果整理成建议
+
+    async def run_direct(self, request: TripRequest, query: str = "", **context) -> str:
+        """
+        并发执行 calls(request, **context) 给出的工具调用，按模板拼接结果。
+        query 仅在 summarize 时作为用户问题交给 LLM；总结失败（超时、出错或空回复）时退回模板文本。
+        """
+        calls = self.calls(request, **context)
+        observations = await asyncio.gather(*(
+            self._execute_tool_call(ToolCall(f"direct_{i}", FunctionCall(name, args)))
+            for i, (name, args) in enumerate(calls)))
+        text = self.template([(name, str(obs)) for (name, _), obs in zip(calls, observations)])
+        if not self.summarize:
+            return text
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": f"{query}\n\n以下是工具查询结果：\n{text}"})
+        response = await self.llm.generate_response(messages=messages, max_tokens=self.config.max_tokens,
+                                                    temperature=self.config.temperature)
+        # generate_response 失败时不抛异常而是返回兜底文案，不能让它替换掉真实的工具结果
+        if getattr(response, "error", None) or not response.content:
+            print(f"⚠️ {self.name} 总结失败（{getattr(response, 'error', None) or '空回复'}），使用工具原始结果")
+            return text
+        return response.content
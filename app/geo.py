@@ -0,0 +1,168 @@
+#==================本地地理计算=====================#
+# 向量化 haversine 距离矩阵 + 最近邻/2-opt 路线排序，
+# 在本地毫秒级完成每日景点排序，不再依赖 LLM 推理或额外的路线工具调用。
+from typing import List, Optional, Sequence
+import numpy as np
+from models.schemas import Attraction, DayPlan, Location, TripPlan
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def to_array(locations: Sequence[Location]) -> np.ndarray:
+    """Location 列表 -> (n, 2) 数组，列为 [经度, 纬度]"""
+    return np.array([[loc.longitude, loc.latitude] for loc in locations], dtype=float).reshape(-1, 2)
+
+
+def haversine_matrix(coords: np.ndarray, others: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    计算球面距离矩阵（米）。coords 形状 (n, 2)，others 形状 (m, 2)，默认与 coords 相同。
+    """
+    others = coords if others is None else others
+    lon1, lat1 = np.radians(coords[:, 0])[:, None], np.radians(coords[:, 1])[:, None]
+    lon2, lat2 = np.radians(others[:, 0])[None, :], np.radians(others[:, 1])[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(order: Sequence[int], dist: np.ndarray) -> float:
+    """开放路径（不回到起点）的总长度"""
+    return float(sum(dist[order[i], order[i + 1]] for i in range(len(order) - 1)))
+
+
+def nearest_neighbour(dist: np.ndarray, start: int = 0) -> List[int]:
+    """从 start 出发，每次走向最近的未访问点"""
+    n = dist.shape[0]
+    order, visited = [start], np.zeros(n, dtype=bool)
+    visited[start] = True
+    for _ in range(n - 1):
+        d = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(np.argmin(d))
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+
+def two_opt(order: List[int], dist: np.ndarray, fixed_start: bool = True, max_rounds: int = 50) -> List[int]:
+    """2-opt 局部优化开放路径：不断反转子段，直到路径不再变短"""
+    order = list(order)
+    n = len(order)
+    first = 1 if fixed_start else 0
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(first, n - 1):
+            for j in range(i + 1, n):
+                a_prev = dist[order[i - 1], order[i]] if i > 0 else 0.0
+                b_prev = dist[order[i - 1], order[j]] if i > 0 else 0.0
+                a_next = dist[order[j], order[j + 1]] if j < n - 1 else 0.0
+                b_next = dist[order[i], order[j + 1]] if j < n - 1 else 0.0
+                if b_prev + b_next < a_prev + a_next - 1e-6:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def best_open_path(dist: np.ndarray, start: Optional[int] = None) -> List[int]:
+    """
+    求较短的开放路径。指定 start 时固定起点；否则尝试每个点作为起点，取最短。
+    """
+    n = dist.shape[0]
+    if n <= 2:
+        return list(range(n)) if start in (None, 0) else [start] + [i for i in range(n) if i != start]
+    starts = [start] if start is not None else range(n)
+    best, best_len = None, np.inf
+    for s in starts:
+        order = two_opt(nearest_neighbour(dist, s), dist, fixed_start=True)
+        length = path_length(order, dist)
+        if length < best_len:
+            best, best_len = order, length
+    return best
+
+
+def order_attractions(attractions: List[Attraction], end: Optional[Location] = None) -> List[Attraction]:
+    """
+    对一天内的景点排序，使总步行/车程最短。
+    提供 end（如当晚酒店）时，路线以离酒店最近的方向收尾。
+    """
+    if len(attractions) < 3 and end is None:
+        return attractions
+    coords = to_array([a.location for a in attractions])
+    if end is not None:
+        # 把酒店作为固定起点求路径，再整体反转，得到“以酒店收尾”的顺序
+        coords = np.vstack([to_array([end]), coords])
+        order = best_open_path(haversine_matrix(coords), start=0)
+        order = [i - 1 for i in reversed(order) if i != 0]
+    else:
+        order = best_open_path(haversine_matrix(coords))
+    return [attractions[i] for i in order]
+
+
+def optimize_day_route(day: DayPlan) -> DayPlan:
+    """原地重排 DayPlan.attractions"""
+    end = day.hotel.location if day.hotel and day.hotel.location else None
+    day.attractions = order_attractions(day.attractions, end)
+    return day
+
+
+def optimize_plan_routes(plan: TripPlan) -> TripPlan:
+    for day in plan.days:
+        optimize_day_route(day)
+    return plan
+
+
+def _kmeans_pp_init(coords: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centers = [coords[rng.integers(len(coords))]]
+    for _ in range(1, k):
+        d = haversine_matrix(coords, np.array(centers)).min(axis=1) ** 2
+        probs = d / d.sum() if d.sum() > 0 else np.full(len(coords), 1 / len(coords))
+        centers.append(coords[rng.choice(len(coords), p=probs)])
+    return np.array(centers)
+
+
+def balanced_kmeans(coords: np.ndarray, k: int, max_iter: int = 30, seed: int = 0) -> np.ndarray:
+    """
+    容量均衡的 k-means：每组最多 ceil(n/k) 个点，保证每天的景点数量相近。
+    返回每个点的组号 (n,)。
+    """
+    n = len(coords)
+    k = max(1, min(k, n))
+    capacity = -(-n // k)
+    rng = np.random.default_rng(seed)
+    centers = _kmeans_pp_init(coords, k, rng)
+    labels = np.full(n, -1)
+    for _ in range(max_iter):
+        dist = haversine_matrix(coords, centers)
+        new_labels = np.full(n, -1)
+        counts = np.zeros(k, dtype=int)
+        # 按“点-中心”距离从近到远贪心分配，已满的组跳过
+        for flat in np.argsort(dist, axis=None):
+            i, c = divmod(int(flat), k)
+            if new_labels[i] == -1 and counts[c] < capacity:
+                new_labels[i] = c
+                counts[c] += 1
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        centers = np.array([coords[labels == c].mean(axis=0) if counts[c] else centers[c] for c in range(k)])
+    return labels
+
+
+def cluster_into_days(pois: List[dict], days: int) -> List[List[dict]]:
+    """
+    把带 location 的候选 POI 按地理位置分成 days 组，组的先后顺序沿中心点路径排列，
+    使相邻两天的区域也尽量相邻；每组内部再按最短路径排序。
+    """
+    if not pois:
+        return []
+    coords = to_array([p["location"] for p in pois])
+    labels = balanced_kmeans(coords, days)
+    groups = [[pois[i] for i in np.where(labels == c)[0]] for c in range(labels.max() + 1)]
+    groups = [g for g in groups if g]
+    centers = np.array([to_array([p["location"] for p in g]).mean(axis=0) for g in groups])
+    ordered = []
+    for c in best_open_path(haversine_matrix(centers)):
+        g = groups[c]
+        inner = best_open_path(haversine_matrix(to_array([p["location"] for p in g])))
+        ordered.append([g[i] for i in inner])
+    return ordered
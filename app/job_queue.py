@@ -0,0 +1,251 @@
+#==================规划任务队列=====================#
+# 固定数量的 worker 从有界队列中取任务执行，限制同时运行的多智能体规划数量；
+# 队列满时提交方立即收到 QueueFullError（API 层转换为 429 + Retry-After），而不是压垮 LLM 与高德配额。
+import time
+import math
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from models.schemas import TripRequest, TripPlan
+from cache.ttl_cache import TTLCache
+from metrics import (trace_id_var, new_trace_id, QUEUE_DEPTH, QUEUE_RUNNING, QUEUE_WAIT_SECONDS,
+                     JOB_SECONDS, JOBS_TOTAL)
+
+logger = logging.getLogger(__name__)
+
+# run_plan(request, on_event) -> (TripPlan, report)
+PlanRunner = Callable[[TripRequest, Optional[Callable]], Awaitable[Tuple[TripPlan, Any]]]
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"规划队列已满，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class PlanJob:
+    """一次规划任务：queued -> running -> succeeded / failed / cancelled"""
+    def __init__(self, request: TripRequest, on_event: Optional[Callable] = None):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.on_event = on_event
+        self.trace_id = trace_id_var.get() or new_trace_id()
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[TripPlan] = None
+        self.report = None
+        self.error: Optional[str] = None
+        self._done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    async def wait(self):
+        await self._done.wait()
+
+    def finish(self, status: str, result: Optional[TripPlan] = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self._done.set()
+
+    def cancel(self):
+        """排队中的任务直接标记取消；运行中的任务取消其协程"""
+        if self.status == "queued":
+            self.finish("cancelled")
+        elif self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        wait_end = self.started_at or self.finished_at or time.time()
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "trace_id": self.trace_id,
+            "created_at": self.created_at,
+            "queue_wait": round(wait_end - self.created_at, 3),
+            "duration": round(self.finished_at - self.started_at, 3)
+            if self.started_at and self.finished_at else None,
+        }
+        if self.error:
+            data["error"] = self.error
+        if include_result and self.result is not None:
+            data["result"] = self.result.model_dump()
+        return data
+
+
+class PlanJobQueue:
+    """
+    有界任务队列 + 固定 worker 池。
+    - workers：同时执行的规划数上限
+    - max_queue：最多排队的任务数，超出时 submit 抛出 QueueFullError
+    - result_ttl / max_jobs：已完成任务的保留时间与数量上限，供 GET 查询结果
+    - store：可选的共享缓存（多 worker 部署时指向同一个 SQLite），任务状态变化时写入快照，
+      使任务在提交它的 worker 之外也能被查询
+    """
+    def __init__(self, run_plan: PlanRunner, workers: int = 2, max_queue: int = 32,
+                 result_ttl: float = 3600, max_jobs: int = 1000, store: Optional[TTLCache] = None):
+        self.run_plan = run_plan
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, PlanJob]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker_tasks = []
+        self._closing = False  # close() 取消 worker 期间置位，用于区分“关闭队列”与“单个任务被取消”
+        self._running = 0
+        self._avg_duration = 30.0  # 任务耗时的指数滑动平均，用于估算 Retry-After
+
+    async def start(self):
+        self._closing = False
+        self._worker_tasks = [asyncio.create_task(self._worker(i), name=f"plan-worker-{i}")
+                              for i in range(self.workers)]
+        print(f"🧵 规划任务队列已启动：{self.workers} 个 worker，队列上限 {self.max_queue}")
+
+    @property
+    def started(self) -> bool:
+        return bool(self._worker_tasks)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def retry_after(self) -> int:
+        """按当前排队长度与平均耗时估算多久后会有空位"""
+        return max(1, math.ceil(self._avg_duration * (self.depth + 1) / self.workers))
+
+    def submit(self, request: TripRequest, on_event: Optional[Callable] = None) -> PlanJob:
+        job = PlanJob(request, on_event)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            JOBS_TOTAL.inc(outcome="rejected")
+            raise QueueFullError(self.retry_after())
+        self._remember(job)
+        self._persist(job)
+        QUEUE_DEPTH.set(self.depth)
+        return job
+
+    def add_finished(self, request: TripRequest, plan: TripPlan) -> PlanJob:
+        """登记一个无需执行即已完成的任务（如命中行程缓存）"""
+        job = PlanJob(request)
+        job.started_at = job.created_at
+        job.finish("succeeded", result=plan)
+        self._remember(job)
+        self._persist(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        return self.jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """本进程之外提交的任务：从共享存储读取最近一次写入的状态快照"""
+        if self.store is None:
+            return None
+        return self.store.get(job_id)
+
+    def _persist(self, job: PlanJob):
+        if self.store is not None:
+            self.store.set(job.id, job.to_dict(), ttl=self.result_ttl)
+
+    def position(self, job: PlanJob) -> Optional[int]:
+        """排队中的任务前面还有几个任务（从 0 开始）"""
+        if job.status != "queued":
+            return None
+        ahead = 0
+        for other in self.jobs.values():
+            if other is job:
+                return ahead
+            if other.status == "queued":
+                ahead += 1
+        return None
+
+    def _remember(self, job: PlanJob):
+        self.jobs[job.id] = job
+        # 清理过期的已完成任务，超出数量上限时再从最早的已完成任务开始删；未完成的任务始终保留
+        cutoff = time.time() - self.result_ttl
+        for job_id in [i for i, j in self.jobs.items() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+        overflow = len(self.jobs) - self.max_jobs
+        if overflow > 0:
+            for job_id in [i for i, j in self.jobs.items() if j.finished][:overflow]:
+                del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job: PlanJob = await self._queue.get()
+            QUEUE_DEPTH.set(self.depth)
+            try:
+                if job.finished:  # 排队期间已被取消
+                    self._persist(job)
+                    continue
+                await self._execute(job)
+            except Exception as e:
+                logger.error(f"规划 worker {index} 处理任务 {job.id} 出错: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: PlanJob):
+        job.started_at = time.time()
+        job.status = "running"
+        self._persist(job)
+        QUEUE_WAIT_SECONDS.observe(job.started_at - job.created_at)
+        self._running += 1
+        QUEUE_RUNNING.set(self._running)
+        # 任务在提交方的 trace 下执行，日志与指标可以串起来
+        token = trace_id_var.set(job.trace_id)
+        try:
+            job._task = asyncio.create_task(self.run_plan(job.request, job.on_event))
+            plan, job.report = await job._task
+            job.finish("succeeded", result=plan)
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+            # 关闭队列时继续向上传播，结束 worker；只是任务被取消时 worker 继续工作
+            if self._closing:
+                raise
+        except Exception as e:
+            job.finish("failed", error=str(e))
+        finally:
+            self._persist(job)
+            trace_id_var.reset(token)
+            self._running -= 1
+            QUEUE_RUNNING.set(self._running)
+            duration = (job.finished_at or time.time()) - job.started_at
+            JOB_SECONDS.observe(duration, outcome=job.status)
+            JOBS_TOTAL.inc(outcome=job.status)
+            if job.status == "succeeded":
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self.depth,
+            "max_queue": self.max_queue,
+            "avg_job_seconds": round(self._avg_duration, 3),
+            "jobs": statuses,
+        }
+
+    async def close(self):
+        self._closing = True
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        # 仍在排队的任务标记为取消，唤醒等待方
+        for job in self.jobs.values():
+            if not job.finished:
+                job.finish("cancelled")
+                self._persist(job)
@@ -0,0 +1,83 @@
+#-----------增量 JSON 解析------------#
+# 在 LLM 逐 token 输出的同时扫描文本，顶层对象中指定数组（如 TripPlan.days）的
+# 每个元素一旦闭合就立即解析出来，不必等待整段 JSON 生成完毕。
+import json
+from typing import Any, Dict, List, Optional
+
+
+class IncrementalJSONArrayParser:
+    """
+    用法:
+        parser = IncrementalJSONArrayParser("days")
+        for chunk in stream:
+            for item in parser.feed(chunk):
+                ...  # item 为已闭合的数组元素（dict）
+        full_text = parser.text
+    顶层对象之前的 Markdown 围栏或说明文字会被忽略。
+    """
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self._buf: List[str] = []      # 已接收的全部文本（按字符）
+        self._pos = 0                  # 下一个待扫描字符的位置
+        self._depth = 0                # 当前括号嵌套深度（对象与数组都计入）
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None  # 最近一个完整字符串，用于识别键名
+        self._current_key: Optional[str] = None  # 顶层对象中当前的键
+        self._array_depth = -1         # 目标数组内部的深度，-1 表示尚未进入
+        self._item_start = -1          # 当前元素起始位置
+        self.items_emitted = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._buf)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """追加一段文本，返回本次新闭合的数组元素"""
+        self._buf.extend(chunk)
+        completed = []
+        buf = self._buf
+        while self._pos < len(buf):
+            i, ch = self._pos, buf[self._pos]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    try:
+                        self._last_string = json.loads("".join(buf[self._string_start:i + 1]))
+                    except ValueError:
+                        self._last_string = None
+                continue
+
+            if self._depth == 0 and ch != "{":
+                continue  # 顶层对象开始之前的内容
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._current_key == self.array_key:
+                    self._array_depth = self._depth
+                elif ch == "{" and self._array_depth != -1 and self._depth == self._array_depth + 1:
+                    self._item_start = i
+            elif ch in "}]":
+                if ch == "}" and self._item_start != -1 and self._depth == self._array_depth + 1:
+                    item_text = "".join(buf[self._item_start:i + 1])
+                    self._item_start = -1
+                    try:
+                        completed.append(json.loads(item_text, strict=False))
+                        self.items_emitted += 1
+                    except ValueError:
+                        pass  # 元素本身不是合法 JSON，留给最终整体解析处理
+                if ch == "]" and self._depth == self._array_depth:
+                    self._array_depth = -1
+                self._depth -= 1
+        return completed
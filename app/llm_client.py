@@ -1,8 +1,12 @@
 #=------------封装LLM调用函数------------=#
 import os
 import json
+import asyncio
 import logging
-from openai import OpenAI
+import time
+import httpx
+from openai import AsyncOpenAI
+from metrics import span, LLM_SECONDS, LLM_TOKENS, LLM_TTFT_SECONDS
 from dotenv import load_dotenv
 #import traceback
 load_dotenv()
@@ -10,6 +14,37 @@ load_dotenv()
 #暴露参数包括messages、tools等
 logger = logging.getLogger(__name__)
 
+# 连接池与并发参数（均可在 .env 中调整）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))          # 同时在途的 LLM 请求上限
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))                        # 单次调用超时(秒)
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "30"))
+
+# 进程内共享的 HTTP 连接池：所有 HelloAgentLLM 实例复用同一组 keep-alive 连接
+_shared_http_client: httpx.AsyncClient | None = None
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """懒加载共享的异步 HTTP 客户端"""
+    global _shared_http_client
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        _shared_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+        )
+    return _shared_http_client
+
+async def close_shared_http_client():
+    """应用关闭时释放连接池"""
+    global _shared_http_client
+    if _shared_http_client is not None and not _shared_http_client.is_closed:
+        await _shared_http_client.aclose()
+    _shared_http_client = None
+
 # 定义响应结构（模拟 OpenAI 的 message 对象）
 class FunctionCall:
     def __init__(self, name: str, arguments: dict):
@@ -22,13 +57,15 @@ class ToolCall:
         self.function = function
 
 class LLMMessage:
-    def __init__(self, content: str, tool_calls: list = None):
+    def __init__(self, content: str, tool_calls: list = None, error: str = None):
         self.content = content
         self.tool_calls = tool_calls or []
+        self.error = error  # 调用失败时为 "timeout" / "error"，content 只是给用户看的兜底文案
 
 
 class HelloAgentLLM:
-    def __init__(self,model:str=None,apiKey:str=None,baseUrl:str=None):
+    def __init__(self,model:str=None,apiKey:str=None,baseUrl:str=None,
+                 max_concurrency:int=None,timeout:float=None):
         self.model = model or os.getenv("LLM_MODEL_ID")
         apiKey = apiKey or os.getenv("LLM_API_KEY")
         baseUrl = baseUrl or os.getenv("LLM_BASE_URL")
@@ -37,11 +74,20 @@ class HelloAgentLLM:
             logger.error("模型ID、API密钥和服务地址必须被提供或在.env文件中定义。")
             raise ValueError("模型ID、API密钥和服务地址必须被提供或在.env文件中定义。")
 
-        self.client = OpenAI(api_key=apiKey,base_url=baseUrl)
+        self.timeout = timeout or LLM_TIMEOUT
+        # 异步客户端 + 共享连接池：await 期间事件循环可以继续处理其他请求
+        self.client = AsyncOpenAI(api_key=apiKey,base_url=baseUrl,http_client=get_shared_http_client())
+        # 限制同时在途的 LLM 调用数，超出的请求在此排队而不是压垮后端
+        self._semaphore = asyncio.Semaphore(max_concurrency or LLM_MAX_CONCURRENCY)
 
     async def generate_response(self,
-    messages:list[dict[str,str]], tools: list[dict] = None,max_tokens:int=4096,temperature:float=0.7):
+    messages:list[dict[str,str]], tools: list[dict] = None,max_tokens:int=4096,temperature:float=0.7,
+    timeout:float=None):
         logger.debug(f"调用LLM模型: {self.model}, max_tokens={max_tokens}, temperature={temperature}")
+        with span("llm.generate", LLM_SECONDS, model=self.model, mode="chat") as s:
+            return await self._generate(s, messages, tools, max_tokens, temperature, timeout)
+
+    async def _generate(self, s, messages, tools, max_tokens, temperature, timeout):
         try:
             # 构建请求参数
             params = {
@@ -57,8 +103,15 @@ class HelloAgentLLM:
                 params["tools"] = tools
                 params["tool_choice"] = "auto"  # 让模型自主决定是否调用工具
 
-            response = self.client.chat.completions.create(**params)
+            queued_at = time.perf_counter()
+            async with self._semaphore:
+                s.set(queue_ms=round((time.perf_counter() - queued_at) * 1000, 2))
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(**params),
+                    timeout=timeout or self.timeout
+                )
             message = response.choices[0].message
+            self._record_usage(s, response)
             #print(f"LLM返回的原始内容:{message}\n")
 
             # 提取文本内容（可能为 None，比如纯工具调用时）,如何确保提取的内容是纯文本的？
@@ -79,15 +132,78 @@ class HelloAgentLLM:
                     tool_call = ToolCall(id=tc.id,function=function_call)
                     tool_calls.append(tool_call)
 
-            print("调用LLM模型成功")
+            print(f"调用LLM模型成功 (prompt={s.attrs.get('prompt_tokens', '?')}, "
+                  f"completion={s.attrs.get('completion_tokens', '?')} tokens)")
             logger.info("LLM模型调用成功")
             return LLMMessage(content=content, tool_calls=tool_calls)  # 去除首尾空格
+        except asyncio.TimeoutError:
+            logger.error(f"调用LLM模型超时（>{timeout or self.timeout}s）")
+            s.set(outcome="timeout")
+            return LLMMessage(content="抱歉，模型响应超时。", tool_calls=[], error="timeout")
         except Exception as e:
             print(f"调用LLM模型失败: {e}")
             #traceback.print_exc()  # 打印完整错误堆栈，这能告诉我到底是什么问题
             logger.error(f"调用LLM模型失败: {e}", exc_info=True)
+            s.set(outcome="error", error=repr(e))
             # exc_info=True 会记录完整的异常堆栈信息
-            return LLMMessage(content="抱歉，我遇到了错误。", tool_calls=[])
+            return LLMMessage(content="抱歉，我遇到了错误。", tool_calls=[], error="error")
+
+    async def stream_response(self, messages: list[dict[str, str]], max_tokens: int = 4096,
+                              temperature: float = 0.7, timeout: float = None):
+        """
+        流式调用：逐段 yield 模型输出的文本增量（不支持工具调用）。
+        timeout 为相邻两段输出之间的最大等待时间；出错时直接抛出异常，由调用方处理。
+        """
+        logger.debug(f"流式调用LLM模型: {self.model}, max_tokens={max_tokens}")
+        timeout = timeout or self.timeout
+        with span("llm.stream", LLM_SECONDS, model=self.model, mode="stream") as s:
+            queued_at = time.perf_counter()
+            async with self._semaphore:
+                s.set(queue_ms=round((time.perf_counter() - queued_at) * 1000, 2))
+                started = time.perf_counter()
+                stream = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                    ),
+                    timeout=timeout
+                )
+                chunks = stream.__aiter__()
+                first_token = True
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                    except StopAsyncIteration:
+                        break
+                    # 部分兼容服务会在最后一个 chunk 附带 usage
+                    self._record_usage(s, chunk)
+                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                        if first_token:
+                            # 首 token 延迟：不含排队时间，反映 prompt 长度与前缀缓存的效果
+                            first_token = False
+                            ttft = time.perf_counter() - started
+                            s.set(ttft_ms=round(ttft * 1000, 2))
+                            LLM_TTFT_SECONDS.observe(ttft, model=self.model)
+                        yield chunk.choices[0].delta.content
+        logger.info("LLM模型流式调用完成")
+
+    def _record_usage(self, s, response):
+        """把 response.usage 中的 token 数记入 span 与计数器"""
+        usage = getattr(response, "usage", None)
+        if not usage:
+            return
+        prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+        # 命中服务端前缀缓存的 prompt token：OpenAI 为 prompt_tokens_details.cached_tokens，
+        # DeepSeek 等兼容服务为 prompt_cache_hit_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or getattr(usage, "prompt_cache_hit_tokens", None) or 0
+        s.set(prompt_tokens=prompt, completion_tokens=completion, cached_tokens=cached)
+        LLM_TOKENS.inc(prompt, model=self.model, kind="prompt")
+        LLM_TOKENS.inc(completion, model=self.model, kind="completion")
+        LLM_TOKENS.inc(cached, model=self.model, kind="cached_prompt")
 
 # #----测试----#
 # if __name__ == "__main__":
@@ -0,0 +1,178 @@
+#==================MCP 服务进程池=====================#
+# 每个服务启动 N 个 stdio 子进程，调用时选择在途请求最少的会话；
+# 后台定期 ping 健康检查，子进程退出或无响应时自动重启。
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+logger = logging.getLogger(__name__)
+
+
+class MCPServerWorker:
+    """
+    单个 MCP 子进程及其会话。
+    stdio_client / ClientSession 的上下文由 worker 自己的后台任务持有，
+    这样重启时可以在任意任务中安全地关闭旧进程。
+    """
+    def __init__(self, name: str, params: StdioServerParameters):
+        self.name = name
+        self.params = params
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float = 30.0):
+        self._task = asyncio.create_task(self._run(), name=f"mcp-worker-{self.name}")
+        ready = asyncio.create_task(self._ready.wait())
+        done, _ = await asyncio.wait({self._task, ready}, timeout=timeout,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if ready not in done:
+            ready.cancel()
+            if self._task.done():
+                self._task.result()  # 抛出启动异常
+            await self.stop()
+            raise TimeoutError(f"MCP 进程 {self.name} 启动超时")
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        finally:
+            self.session = None
+
+    async def stop(self):
+        self._stop.set()
+        if self._task and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except (asyncio.TimeoutError, Exception) as e:
+                logger.warning(f"关闭 MCP 进程 {self.name} 时出错: {e!r}")
+                self._task.cancel()
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+
+class MCPServerPool:
+    """
+    同一 MCP 服务的进程池，对外提供与 ClientSession 相同的 call_tool / list_tools。
+    """
+    def __init__(self, name: str, params: StdioServerParameters, size: int = 1,
+                 health_interval: float = 30.0, health_timeout: float = 5.0):
+        self.name = name
+        self.params = params
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.workers: List[MCPServerWorker] = []
+        self.restarts = 0
+        self._health_task: Optional[asyncio.Task] = None
+        self._respawn_lock = asyncio.Lock()
+        self._worker_seq = 0
+
+    def _new_worker(self) -> MCPServerWorker:
+        self._worker_seq += 1
+        return MCPServerWorker(f"{self.name}-{self._worker_seq}", self.params)
+
+    async def start(self):
+        """并发启动所有子进程，并开启健康检查"""
+        self.workers = [self._new_worker() for _ in range(self.size)]
+        await asyncio.gather(*(w.start() for w in self.workers))
+        self._health_task = asyncio.create_task(self._health_loop(), name=f"mcp-health-{self.name}")
+        print(f"MCP 进程池 {self.name} 已启动 {self.size} 个子进程")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """取出在途请求最少的健康会话"""
+        candidates = [w for w in self.workers if w.alive]
+        if not candidates:
+            await self._respawn_dead()
+            candidates = [w for w in self.workers if w.alive]
+            if not candidates:
+                raise RuntimeError(f"MCP 服务 {self.name} 没有可用的子进程")
+        worker = min(candidates, key=lambda w: w.in_flight)
+        worker.in_flight += 1
+        try:
+            yield worker.session
+        except Exception:
+            # 调用出错时确认子进程是否还活着，死掉的在后台重启
+            if not await worker.ping(self.health_timeout):
+                await worker.stop()
+                asyncio.create_task(self._respawn_dead())
+            raise
+        finally:
+            worker.in_flight -= 1
+
+    async def call_tool(self, name: str, arguments: dict = None):
+        async with self.acquire() as session:
+            return await session.call_tool(name, arguments=arguments or {})
+
+    async def list_tools(self):
+        async with self.acquire() as session:
+            return await session.list_tools()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"MCP 进程池 {self.name} 健康检查失败: {e}", exc_info=True)
+
+    async def check_health(self):
+        """ping 所有子进程，无响应的标记后重启"""
+        results = await asyncio.gather(*(w.ping(self.health_timeout) for w in self.workers))
+        for worker, ok in zip(self.workers, results):
+            if not ok and worker.alive:
+                logger.warning(f"MCP 进程 {worker.name} 健康检查无响应，准备重启")
+                await worker.stop()
+        await self._respawn_dead()
+
+    async def _respawn_dead(self):
+        async with self._respawn_lock:
+            for i, worker in enumerate(self.workers):
+                if worker.alive:
+                    continue
+                await worker.stop()
+                replacement = self._new_worker()
+                try:
+                    await replacement.start()
+                except Exception as e:
+                    logger.error(f"MCP 进程 {replacement.name} 重启失败: {e}")
+                    continue
+                self.workers[i] = replacement
+                self.restarts += 1
+                print(f"♻️ MCP 进程 {worker.name} 已重启为 {replacement.name}")
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "alive": sum(1 for w in self.workers if w.alive),
+            "in_flight": [w.in_flight for w in self.workers],
+            "restarts": self.restarts,
+        }
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        await asyncio.gather(*(w.stop() for w in self.workers), return_exceptions=True)
+        self.workers = []
@@ -0,0 +1,232 @@
+#==================指标与链路追踪=====================#
+# 进程内的 Prometheus 风格指标（Counter / Histogram）与计时 span：
+# 每个 span 结束时写入对应直方图，并输出一行带 trace_id 的结构化日志，
+# 用于区分一次慢请求到底慢在 LLM、高德工具调用还是结构化解析。
+import os
+import json
+import time
+import asyncio
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("metrics")
+if os.getenv("SPAN_LOG", "0") == "1":
+    # 打开后每个 span 输出一行 JSON 日志（stderr），便于按 trace_id 检索单次请求
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# 当前请求的追踪 ID，由 API 中间件设置，在同一请求派生的协程中自动传递
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> str:
+    return trace_id_var.get()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """单调递增计数器，按标签分组"""
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值，如队列长度"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """累积分桶直方图，输出 _bucket / _sum / _count，与 Prometheus 文本格式一致"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # 标签 -> [各桶计数, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels.get(n, "")) for n in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                labels = _format_labels(self.labelnames, key, ("le", f"{bound:g}"))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """导出 Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# ---------- 业务指标 ----------
+HTTP_SECONDS = REGISTRY.histogram(
+    "travel_http_request_duration_seconds", "API 请求耗时", ("method", "path", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "travel_stage_duration_seconds", "规划阶段耗时", ("stage", "outcome"))
+LLM_SECONDS = REGISTRY.histogram(
+    "travel_llm_call_duration_seconds", "LLM 调用耗时", ("model", "mode", "outcome"))
+LLM_TOKENS = REGISTRY.counter(
+    "travel_llm_tokens_total", "LLM 消耗的 token 数（来自 response.usage；cached_prompt 为命中前缀缓存的部分）", ("model", "kind"))
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "travel_llm_time_to_first_token_seconds", "流式 LLM 调用的首 token 延迟（不含排队）", ("model",))
+TOOL_SECONDS = REGISTRY.histogram(
+    "travel_tool_call_duration_seconds", "MCP 工具调用耗时", ("tool", "outcome"))
+PREFETCH_TOTAL = REGISTRY.counter(
+    "travel_prefetch_total", "规划开始时预取的工具调用（hit 被专家复用 / unused 未被使用 / error 失败）",
+    ("tool", "outcome"))
+PARSE_SECONDS = REGISTRY.histogram(
+    "travel_structured_parse_duration_seconds", "结构化输出解析耗时（outcome=repaired 表示经过 LLM 修正）", ("model", "outcome"),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5, 30))  # 含 LLM 修正时会到秒级
+STRUCTURED_REPAIRS = REGISTRY.counter(
+    "travel_structured_repairs_total", "结构化输出修复次数（local 本地修正 / llm 局部重问 / syntax 语法重写）",
+    ("model", "kind", "outcome"))
+QUEUE_DEPTH = REGISTRY.gauge("travel_plan_queue_depth", "排队等待执行的规划任务数")
+QUEUE_RUNNING = REGISTRY.gauge("travel_plan_jobs_running", "正在执行的规划任务数")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "travel_plan_queue_wait_seconds", "规划任务从入队到开始执行的等待时间")
+JOB_SECONDS = REGISTRY.histogram("travel_plan_job_duration_seconds", "规划任务执行耗时", ("outcome",))
+JOBS_TOTAL = REGISTRY.counter("travel_plan_jobs_total", "规划任务数（按结果）", ("outcome",))
+
+
+class Span:
+    """
+    计时 span：with span(...) as s 结束时写入直方图并输出结构化日志。
+    s.set(...) 可补充标签或日志字段；未显式设置 outcome 时，正常结束为 ok，
+    被取消为 cancelled，其他异常为 error。
+    """
+    def __init__(self, name: str, histogram: Optional[Histogram] = None, **attrs):
+        self.name = name
+        self.histogram = histogram
+        self.attrs = attrs
+        self.duration = 0.0
+        self._start = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        if exc_type is None:
+            self.attrs.setdefault("outcome", "ok")
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            self.attrs.setdefault("outcome", "cancelled")
+        else:
+            self.attrs.setdefault("outcome", "error")
+            self.attrs.setdefault("error", repr(exc))
+        if self.histogram is not None:
+            self.histogram.observe(self.duration, **self.attrs)
+        logger.info(json.dumps({
+            "span": self.name,
+            "trace_id": current_trace_id(),
+            "duration_ms": round(self.duration * 1000, 2),
+            **self.attrs,
+        }, ensure_ascii=False, default=str))
+        return False
+
+
+def span(name: str, histogram: Optional[Histogram] = None, **attrs) -> Span:
+    return Span(name, histogram, **attrs)
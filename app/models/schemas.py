@@ -37,6 +37,11 @@ class POISearchRequest(BaseModel):
     citylimit: bool = Field(default=True, description="是否限制在城市范围内")
 
 
+class POIPhotoBatchRequest(BaseModel):
+    """景点配图批量请求"""
+    names: List[str] = Field(..., description="景点名称列表", max_length=100, example=["故宫", "天坛"])
+
+
 class RouteRequest(BaseModel):
     """路线规划请求"""
     origin_address: str = Field(..., description="起点地址", example="北京市朝阳区阜通东大街6号")
@@ -0,0 +1,85 @@
+#==================景点配图解析（批量 + 缓存）=====================#
+import os
+import asyncio
+from typing import Dict, List, Optional
+from cache.ttl_cache import TTLCache, cache_db_path
+from services.photo_defaults import PLACEHOLDER_PHOTO_URL
+
+PHOTO_CACHE_TTL = 30 * 24 * 3600       # 找到图片：缓存 30 天
+PHOTO_NEGATIVE_TTL = 24 * 3600         # 只拿到占位图：缓存 1 天后再试
+
+
+class _LeaderCancelled(Exception):
+    """合并请求的发起者被取消：等待者据此自行重新查询（与等待者自己被取消区分开）"""
+
+
+class POIPhotoResolver:
+    """
+    景点名 -> 图片 URL。
+    先查缓存（可选 SQLite 持久化），未命中时通过 Unsplash MCP 会话查询；
+    同名的并发查询只发起一次，占位图结果也会被缓存（较短 TTL）。
+    """
+    def __init__(self, session, cache: Optional[TTLCache] = None, max_concurrency: int = 8):
+        self.session = session
+        self.cache = cache or TTLCache(
+            namespace="poi_photos",
+            max_entries=int(os.getenv("PHOTO_CACHE_MAX_ENTRIES", "4096")),
+            db_path=cache_db_path("PHOTO_CACHE_DB"),
+        )
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return " ".join(name.split()).lower()
+
+    async def resolve(self, name: str) -> str:
+        key = self._key(name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # 合并同名的并发请求：shield 保证某个等待者被取消时不会连带取消共享的 future
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except _LeaderCancelled:
+                # 发起查询的协程被取消：由自己重新发起查询；自己被取消时 CancelledError 照常向上传播
+                return await self.resolve(name)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            async with self._semaphore:
+                result = await self.session.call_tool("get_poi_photo", arguments={"name": name.strip()})
+            # MCP 返回的是 content 列表，提取其中的 text (即图片 URL)
+            url = result.content[0].text if result.content else ""
+            url = url or PLACEHOLDER_PHOTO_URL
+            ttl = PHOTO_NEGATIVE_TTL if url == PLACEHOLDER_PHOTO_URL else PHOTO_CACHE_TTL
+            self.cache.set(key, url, ttl)
+            future.set_result(url)
+            return url
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # 发起者被取消：结束 future，让合并进来的等待者不会永远挂起
+            future.set_exception(_LeaderCancelled())
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            # 没有其他等待者时取走异常，避免 "exception was never retrieved" 警告
+            if future.done():
+                future.exception()
+
+    async def resolve_many(self, names: List[str]) -> Dict[str, str]:
+        """批量解析：去重后并发查询，单个失败时回退为占位图"""
+        unique = list(dict.fromkeys(n for n in names if n and n.strip()))
+        results = await asyncio.gather(*(self.resolve(n) for n in unique), return_exceptions=True)
+        photos = {}
+        for name, url in zip(unique, results):
+            if isinstance(url, Exception):
+                print(f"Unsplash Call Error ({name}): {url}")
+                url = PLACEHOLDER_PHOTO_URL
+            photos[name] = url
+        return photos
@@ -0,0 +1,137 @@
+#-----------单次规划的 POI 记录------------#
+# 高德工具返回的机器可读 POI 记录在一次规划内汇总到 POIStore：
+# 酒店搜索的中心坐标、按天聚类的候选景点、行程中景点/酒店的坐标校正都直接读取这些记录，
+# 不再用正则从专家的自然语言回复里反解析名称和坐标。
+import contextvars
+from typing import Dict, Iterable, List, Optional, Sequence
+from services.poi_index import haversine_m
+from models.schemas import DayPlan, Location, TripPlan, WeatherInfo
+
+# 景点候选来自文本搜索，酒店来自酒店搜索与周边搜索
+ATTRACTION_TOOLS = ("amap_maps_text_search",)
+HOTEL_TOOLS = ("amap_hotel_search", "search_nearby", "amap_maps_poi_detail")
+
+# 当前规划请求的 POIStore，由编排层设置；工具调用在同一上下文派生的协程中执行，自动写入
+poi_store_var: contextvars.ContextVar[Optional["POIStore"]] = contextvars.ContextVar("poi_store", default=None)
+
+
+def current_poi_store() -> Optional["POIStore"]:
+    return poi_store_var.get()
+
+
+class POIStore:
+    """按 POI id 去重保存一次规划中工具返回的记录，并记录每条记录来自哪些工具；天气工具的逐日预报按日期保存"""
+    def __init__(self):
+        self._records: Dict[str, dict] = {}
+        self.forecasts: Dict[str, dict] = {}  # 日期 -> WeatherInfo 字段
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, records: Iterable[dict], source: str):
+        for r in records:
+            key = r.get("id") or f"{r.get('name')}@{r.get('lon')},{r.get('lat')}"
+            existing = self._records.get(key)
+            if existing is None:
+                self._records[key] = dict(r, sources=[source])
+                continue
+            # 同一 POI 被多个工具返回时合并：后到的非空字段补齐先前缺失的字段
+            for k, v in r.items():
+                if v not in (None, "") and existing.get(k) in (None, ""):
+                    existing[k] = v
+            if source not in existing["sources"]:
+                existing["sources"].append(source)
+
+    def add_forecasts(self, forecasts: Iterable[dict]):
+        for f in forecasts:
+            self.forecasts[f["date"]] = f
+
+    def records(self, sources: Optional[Sequence[str]] = None) -> List[dict]:
+        if sources is None:
+            return list(self._records.values())
+        return [r for r in self._records.values() if any(s in r["sources"] for s in sources)]
+
+    def mentioned_in(self, text: str, sources: Optional[Sequence[str]] = None) -> List[dict]:
+        """文本中提到的记录，按首次出现的位置排序（用于找出专家最终推荐了哪些 POI）"""
+        hits = [(text.find(r["name"]), r) for r in self.records(sources) if r.get("name")]
+        return [r for pos, r in sorted((h for h in hits if h[0] >= 0), key=lambda h: h[0])]
+
+    def find(self, name: str, sources: Optional[Sequence[str]] = None) -> Optional[dict]:
+        """按名称查找：先精确匹配，再匹配互相包含的名称（如“西湖”与“西湖风景名胜区”），取最接近的一个"""
+        if not name:
+            return None
+        candidates = self.records(sources)
+        for r in candidates:
+            if r["name"] == name:
+                return r
+        partial = [r for r in candidates
+                   if len(r["name"]) >= 2 and len(name) >= 2 and (r["name"] in name or name in r["name"])]
+        return min(partial, key=lambda r: abs(len(r["name"]) - len(name)), default=None)
+
+    @staticmethod
+    def centroid(records: Sequence[dict]) -> Optional[str]:
+        """记录坐标的中心点，格式为高德的 '经度,纬度'"""
+        if not records:
+            return None
+        lon = sum(r["lon"] for r in records) / len(records)
+        lat = sum(r["lat"] for r in records) / len(records)
+        return f"{lon:.6f},{lat:.6f}"
+
+
+def ground_days(days: Iterable[DayPlan], store: POIStore, max_drift_m: float = 300) -> int:
+    """
+    用工具返回的真实记录校正每日行程：景点/酒店能在记录中找到时，坐标偏离超过 max_drift_m 则改用记录坐标，
+    并补齐缺失的地址、评分与价格（预算汇总依赖酒店的 estimated_cost）；有当天预报时以预报覆盖天气描述。
+    返回修改的字段数。
+    """
+    fixes = 0
+
+    def fix_location(item, record) -> int:
+        loc = item.location
+        if loc is None or haversine_m(loc.longitude, loc.latitude, record["lon"], record["lat"]) > max_drift_m:
+            item.location = Location(longitude=record["lon"], latitude=record["lat"])
+            return 1
+        return 0
+
+    for day in days:
+        forecast = store.forecasts.get(day.date)
+        if forecast and day.weather != weather_summary(forecast):
+            day.weather = weather_summary(forecast)
+            fixes += 1
+        for attraction in day.attractions:
+            record = store.find(attraction.name, ATTRACTION_TOOLS)
+            if record is None:
+                continue
+            fixes += fix_location(attraction, record)
+            if not attraction.address and record["address"]:
+                attraction.address = record["address"]
+                fixes += 1
+        hotel = day.hotel
+        record = store.find(hotel.name, HOTEL_TOOLS) if hotel else None
+        if record is None:
+            continue
+        fixes += fix_location(hotel, record)
+        if not hotel.address and record["address"]:
+            hotel.address = record["address"]
+            fixes += 1
+        if not hotel.rating and record["rating"] is not None:
+            hotel.rating = f"{record['rating']:g}"
+            fixes += 1
+        if not hotel.estimated_cost and record["cost"]:
+            hotel.estimated_cost = int(record["cost"])
+            fixes += 1
+    return fixes
+
+
+def weather_summary(forecast: dict) -> str:
+    """逐日预报的简短描述，如“晴”或“多云转小雨”"""
+    day, night = forecast["day_weather"], forecast["night_weather"]
+    return day if day == night else f"{day}转{night}"
+
+
+def ground_weather_info(plan: TripPlan, store: POIStore) -> int:
+    """行程日期有高德预报时，用预报替换 LLM 生成的 weather_info；返回采用的预报天数"""
+    forecasts = [store.forecasts[d.date] for d in plan.days if d.date in store.forecasts]
+    if forecasts:
+        plan.weather_info = [WeatherInfo(**f) for f in forecasts]
+    return len(forecasts)
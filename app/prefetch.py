@@ -0,0 +1,96 @@
+#-----------规划请求的工具预取------------#
+# TripRequest 到达时，城市、日期、偏好、住宿类型都已确定，天气、按偏好的景点搜索、按住宿类型的酒店搜索
+# 这几次高德调用完全可以预测。预取器在第一轮 LLM 思考的同时并发发起这些调用：
+# 专家随后以相同参数调用工具时直接复用（仍在进行中则等待同一个任务），结果也会写入 MCP 端的工具缓存。
+import asyncio
+import contextvars
+from typing import Dict, List, Optional, Tuple
+from models.schemas import TripRequest
+from metrics import PREFETCH_TOTAL
+from cache.ttl_cache import make_cache_key
+
+# 当前规划请求的预取器，由编排层设置；AmapMCPTool.run 调用前先查这里
+prefetcher_var: contextvars.ContextVar[Optional["Prefetcher"]] = contextvars.ContextVar("prefetcher", default=None)
+
+
+def current_prefetcher() -> Optional["Prefetcher"]:
+    return prefetcher_var.get()
+
+
+def call_key(tool, arguments: dict) -> str:
+    """
+    工具名 + 补齐默认值后的参数，按工具缓存的规则规范化（去空白、转小写）：
+    LLM 省略默认参数或只在大小写、空白上不同时也能与预取的调用对上
+    """
+    args = {name: spec["default"] for name, spec in (tool.input_schema or {}).get("properties", {}).items()
+            if "default" in spec}
+    args.update(arguments)
+    return make_cache_key(tool.name, args)
+
+
+def weather_args(request: TripRequest) -> dict:
+    return {"city": request.city, "start_date": request.start_date, "end_date": request.end_date}
+
+
+def hotel_args(request: TripRequest) -> dict:
+    return {"city": request.city, "keywords": request.accommodation or "酒店"}
+
+
+def predictable_calls(request: TripRequest) -> List[Tuple[str, dict]]:
+    """根据请求即可确定参数的工具调用；天气与酒店的参数和 direct 模式专家的调用一致"""
+    calls = [("amap_maps_weather", weather_args(request))]
+    for keyword in request.preferences:
+        calls.append(("amap_maps_text_search", {"keywords": keyword, "city": request.city}))
+    calls.append(("amap_hotel_search", hotel_args(request)))
+    return calls
+
+
+class Prefetcher:
+    """一次规划内的预取任务表：key -> 进行中或已完成的工具调用任务"""
+    def __init__(self, tools: Dict[str, object]):
+        self.tools = tools  # 工具名 -> AmapMCPTool
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._used: set = set()
+
+    def start(self, request: TripRequest) -> int:
+        """立即并发发起可预测的调用，返回发起的数量；目录中没有的工具跳过"""
+        for name, arguments in predictable_calls(request):
+            tool = self.tools.get(name)
+            if tool is None:
+                continue
+            key = call_key(tool, arguments)
+            if key not in self._tasks:
+                self._tasks[key] = asyncio.create_task(tool.call(**arguments), name=f"prefetch-{name}")
+        return len(self._tasks)
+
+    async def lookup(self, tool, arguments: dict):
+        """返回预取结果；没有预取过、或预取失败时返回 None，由调用方正常调用工具"""
+        key = call_key(tool, arguments)
+        task = self._tasks.get(key)
+        if task is None:
+            return None
+        try:
+            # shield：专家的调用超时被取消时，不连带取消预取任务本身
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception:
+            PREFETCH_TOTAL.inc(tool=tool.name, outcome="error")
+            return None
+        if key not in self._used:
+            self._used.add(key)
+            PREFETCH_TOTAL.inc(tool=tool.name, outcome="hit")
+        return result
+
+    def close(self):
+        """规划结束：未被使用的预取计为 unused，仍在进行的任务取消"""
+        for key, task in self._tasks.items():
+            if key in self._used:
+                continue
+            PREFETCH_TOTAL.inc(tool=key.split(":", 1)[0], outcome="unused")
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # 取走异常，避免 "Task exception was never retrieved" 警告
@@ -1,30 +1,153 @@
 import os
-import requests
+import sys
+import json
+import asyncio
+import inspect
+import functools
+import contextvars
+from datetime import date, datetime, timedelta, timezone
 from fastmcp import FastMCP
 
+# 以脚本方式启动时，把 app 目录加入模块搜索路径，便于复用公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.http_client import AsyncHTTPClient
+from cache.ttl_cache import TTLCache, make_cache_key, cache_db_path
+from services.poi_index import POIIndex, parse_location, poi_record
+from services.city_index import CityIndex
+from models.schemas import WeatherInfo
+
 # 初始化 MCP 服务端
 mcp = FastMCP("AmapMapService")
 
 # 从环境变量获取高德 API KEY
 AMAP_API_KEY = os.getenv("AMAP_API_KEY")
+# 高德 Web 服务地址，压测时可指向本地模拟服务
+AMAP_BASE_URL = os.getenv("AMAP_BASE_URL", "https://restapi.amap.com").rstrip("/")
+
+# 进程内共享的 HTTP 客户端：持久连接，多个并发工具调用复用同一连接池
+http_client = AsyncHTTPClient()
+
+# 高德预报天气每天在这几个整点左右发布（北京时间），缓存到下一次发布之后
+CHINA_TZ = timezone(timedelta(hours=8))
+FORECAST_UPDATE_HOURS = sorted(int(h) for h in os.getenv("AMAP_FORECAST_UPDATE_HOURS", "8,11,18").split(","))
+FORECAST_UPDATE_DELAY = 10 * 60  # 发布时间只是“左右”，多等 10 分钟再视为过期
+FORECAST_DAYS = 4  # extensions=all 返回今天起 4 天的预报
+
+
+def seconds_until_forecast_update(now: datetime = None) -> float:
+    now = now or datetime.now(CHINA_TZ)
+    for offset in (0, 1):
+        day = (now + timedelta(days=offset)).replace(minute=0, second=0, microsecond=0)
+        for hour in FORECAST_UPDATE_HOURS:
+            refresh = day.replace(hour=hour) + timedelta(seconds=FORECAST_UPDATE_DELAY)
+            if refresh > now:
+                return (refresh - now).total_seconds()
+    return 24 * 3600
+
+
+# 工具结果缓存：按工具设置 TTL（秒），天气变化快只缓存几分钟，POI/详情数据缓存数天
+# TTL 也可以是函数，按本次调用的参数计算（如预报天气缓存到高德下一次更新）
+TOOL_TTLS = {
+    "amap_maps_weather": lambda args: seconds_until_forecast_update() if args.get("forecast") else 30 * 60,
+    "amap_maps_text_search": 3 * 24 * 3600,
+    "amap_hotel_search": 3 * 24 * 3600,
+    "amap_maps_poi_detail": 7 * 24 * 3600,
+    "amap_maps_direction": 24 * 3600,
+    "amap_route_matrix": 24 * 3600,
+    "search_nearby": 24 * 3600,
+}
+tool_cache = TTLCache(
+    namespace="amap_tools",
+    max_entries=int(os.getenv("AMAP_CACHE_MAX_ENTRIES", "2048")),
+    db_path=cache_db_path("AMAP_CACHE_DB"),  # 未配置时仅使用内存缓存；多 worker 部署时共用 CACHE_DB
+)
+
+# 按 (adcode, 日期) 缓存的逐日预报：同一城市同一天的所有规划（无论城市名写法、行程日期）共用一次抓取
+forecast_cache = TTLCache(
+    namespace="amap_forecast",
+    max_entries=int(os.getenv("AMAP_FORECAST_MAX_ENTRIES", "1024")),
+    db_path=cache_db_path("AMAP_CACHE_DB"),
+)
+
+# 随代码分发的城市名 -> adcode 索引，天气按 adcode 查询
+city_index = CityIndex()
+
+# 高德返回过的 POI 的网格空间索引：周边搜索在覆盖新鲜的网格内直接本地回答
+poi_index = POIIndex(
+    cell_size=float(os.getenv("POI_INDEX_CELL_SIZE", "0.01")),
+    max_cells=int(os.getenv("POI_INDEX_MAX_CELLS", "2048")),
+    ttl=float(os.getenv("POI_INDEX_TTL", str(7 * 24 * 3600))),
+    db_path=cache_db_path("POI_INDEX_DB"),
+)
+NEARBY_FETCH_SIZE = 20  # 回源时多取一些，按距离排序后填充索引
+
+# 记录本次工具调用中的高德请求是否全部成功，失败结果不写入缓存
+_call_ok = contextvars.ContextVar("amap_call_ok", default=None)
+
+def cached_tool(func):
+    """按“工具名 + 规范化参数（含默认值）”缓存工具返回值"""
+    signature = inspect.signature(func)
+    ttl = TOOL_TTLS.get(func.__name__, 3600)
 
-def _make_request(url, params):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_cache_key(func.__name__, bound.arguments)
+        cached = tool_cache.get(key)
+        if cached is not None:
+            return cached
+
+        state = {"ok": True}
+        token = _call_ok.set(state)
+        try:
+            result = await func(*args, **kwargs)
+        finally:
+            _call_ok.reset(token)
+        if state["ok"]:
+            tool_cache.set(key, result, ttl(bound.arguments) if callable(ttl) else ttl)
+        return result
+    return wrapper
+
+def _typed(text: str, pois: list = (), data: dict = None) -> str:
+    """
+    工具的结构化返回：text 是给 LLM 阅读的紧凑文本，records 是机器可读的 POI 记录
+    （id / name / address / type / lon / lat / rating / cost），data 为其他结构化结果。
+    客户端据此拆出文本交给 LLM，记录留给编排层使用，不必再用正则从文本里抠坐标。
+    """
+    payload = {"text": text, "records": [r for r in map(poi_record, pois) if r]}
+    if data is not None:
+        payload["data"] = data
+    return json.dumps(payload, ensure_ascii=False)
+
+def _mark_failed():
+    state = _call_ok.get()
+    if state is not None:
+        state["ok"] = False
+
+async def _make_request(url, params):
     """通用请求处理函数"""
     if not AMAP_API_KEY:
-        return "错误：未配置 AMAP_API_KEY 环境变量。"
+        _mark_failed()
+        return {"status": "0", "info": "未配置 AMAP_API_KEY 环境变量。"}
     
     params["key"] = AMAP_API_KEY
     params["output"] = "json"
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        return response.json()
+        data = await http_client.get_json(url, params=params)
     except Exception as e:
+        _mark_failed()
         return {"status": "0", "info": f"网络请求异常: {str(e)}"}
+    # v3 接口以 status=="1" 表示成功，v4（骑行）以 errcode==0 表示成功
+    if data.get("status") != "1" and data.get("errcode") != 0:
+        _mark_failed()
+    return data
 
 
 @mcp.tool()
-def amap_maps_text_search(keywords: str, city: str = None) -> str:
+@cached_tool
+async def amap_maps_text_search(keywords: str, city: str = None) -> str:
     """
     搜索高德地图上的地点、景点、酒店或餐厅信息。
     :param keywords: 搜索关键词，如 '故宫'、'五星级酒店'
@@ -33,14 +156,16 @@ def amap_maps_text_search(keywords: str, city: str = None) -> str:
     if not AMAP_API_KEY:
         return "错误：未配置 AMAP_API_KEY 环境变量。"
 
-    url = "https://restapi.amap.com/v3/place/text"
+    url = f"{AMAP_BASE_URL}/v3/place/text"
     params = {"keywords": keywords, "city": city, "offset": 3, "page": 1}
-    data = _make_request(url,params)
+    data = await _make_request(url,params)
 
     if data.get("status") == "1":
         pois = data.get("pois", [])
+        poi_index.add_pois(pois, keywords)
         if not pois: return "未找到相关地点。"
-        return "\n".join([f"名称: {p['name']}, 地址: {p['address']}, ID: {p['id']}, 坐标: {p['location']}" for p in pois])
+        text = "\n".join([f"名称: {p['name']}, 地址: {p['address']}, ID: {p['id']}, 坐标: {p['location']}" for p in pois])
+        return _typed(text, pois)
     return f"搜索失败: {data.get('info')}"
 
     # try:
@@ -62,30 +187,100 @@ def amap_maps_text_search(keywords: str, city: str = None) -> str:
     #     return f"接口调用异常: {str(e)}"
 
 @mcp.tool()
-def amap_maps_weather(city: str) -> str:
+@cached_tool
+async def amap_maps_weather(city: str, start_date: str = None, end_date: str = None, forecast: bool = True) -> str:
     """
-    查询指定城市的天气信息。
+    查询指定城市的天气。默认返回逐日预报（高德只提供今天起 4 天），forecast=False 时返回实时天气。
     :param city: 城市名称或城市编码，如 '杭州' 或 '330100'
+    :param start_date: 行程开始日期 YYYY-MM-DD（可选），只返回行程期间的预报
+    :param end_date: 行程结束日期 YYYY-MM-DD（可选）
+    :param forecast: 是否查询预报，默认 True
     """
     if not AMAP_API_KEY:
         return "错误：未配置 AMAP_API_KEY 环境变量。"
 
-    url = "https://restapi.amap.com/v3/weather/weatherInfo"
-    params = {"city": city, "extensions": "base"}
+    # 索引中没有的城市（如较小的县镇）退回到原始名称，由高德解析
+    adcode = city_index.resolve(city) or city.strip()
+    if not forecast:
+        return await _live_weather(adcode)
+
+    today = datetime.now(CHINA_TZ).date()
+    horizon = [(today + timedelta(days=i)).isoformat() for i in range(FORECAST_DAYS)]
+    trip_dates = _date_range(start_date, end_date)
+    wanted = [d for d in trip_dates if d in horizon]
+    # 行程完全不在预报范围内时给出近期预报作参考
+    reference = not wanted
+    if reference:
+        wanted = horizon
+
+    casts = {d: forecast_cache.get(f"{adcode}:{d}") for d in wanted}
+    name = city_index.name_of(adcode) or city
+    if any(c is None for c in casts.values()):
+        data = await _make_request(f"{AMAP_BASE_URL}/v3/weather/weatherInfo", {"city": adcode, "extensions": "all"})
+        forecasts = data.get("forecasts") or []
+        if data.get("status") != "1" or not forecasts:
+            return f"查询失败：{data.get('info') or '未查询到该城市的天气预报。'}"
+        name = city_index.name_of(adcode) or forecasts[0].get("city") or city
+        ttl = seconds_until_forecast_update()
+        for cast in forecasts[0].get("casts", []):
+            info = _weather_info(cast)
+            forecast_cache.set(f"{adcode}:{info['date']}", info, ttl)
+            if info["date"] in casts:
+                casts[info["date"]] = info
 
-    data = _make_request(url, params)
+    found = [casts[d] for d in wanted if casts.get(d)]
+    lines = [f"{name} 天气预报（{'行程日期不在预报范围内，以下为近期预报，仅供参考' if reference else '行程期间'}）:"]
+    for w in found:
+        lines.append(f"{w['date']}: 白天{w['day_weather']} {w['day_temp']}°C，夜间{w['night_weather']} "
+                     f"{w['night_temp']}°C，{w['wind_direction']}风 {w['wind_power']}级")
+    unavailable = [d for d in trip_dates if d not in casts or not casts[d]] if trip_dates else []
+    if unavailable:
+        lines.append(f"{'、'.join(unavailable)} 超出高德预报范围（仅提供今天起 {FORECAST_DAYS} 天），请提醒出行前再次核实。")
+    return _typed("\n".join(lines), data={"city": name, "adcode": adcode,
+                                          "forecasts": found,
+                                          "unavailable_dates": unavailable})
+
+
+async def _live_weather(city: str) -> str:
+    """实时天气（extensions=base）"""
+    url = f"{AMAP_BASE_URL}/v3/weather/weatherInfo"
+    data = await _make_request(url, {"city": city, "extensions": "base"})
 
     if data.get("status") == "1":
-            lives = data.get("lives", [])
-            if not lives:
-                return "未查询到该城市的天气信息。"
-            w = lives[0]
-            return f"城市: {w['city']}, 天气: {w['weather']}, 温度: {w['temperature']}°C, 风向: {w['winddirection']}, 湿度: {w['humidity']}%"
+        lives = data.get("lives", [])
+        if not lives:
+            return "未查询到该城市的天气信息。"
+        w = lives[0]
+        text = f"城市: {w['city']}, 天气: {w['weather']}, 温度: {w['temperature']}°C, 风向: {w['winddirection']}, 湿度: {w['humidity']}%"
+        return _typed(text, data={k: w.get(k) for k in ("city", "weather", "temperature", "winddirection",
+                                                      "windpower", "humidity", "reporttime")})
     return f"查询失败：{data.get('info')}"
 
-#FastMCP的@tool装饰器通常期望同步函数，异步声明可能导致协议层异常
+
+def _weather_info(cast: dict) -> dict:
+    """高德逐日预报 -> WeatherInfo 字段"""
+    return WeatherInfo(
+        date=cast["date"], day_weather=cast.get("dayweather") or "未知", night_weather=cast.get("nightweather") or "未知",
+        day_temp=cast.get("daytemp") or 0, night_temp=cast.get("nighttemp") or 0,
+        wind_direction=cast.get("daywind") or "无数据", wind_power=cast.get("daypower") or "无数据",
+    ).model_dump()
+
+
+def _date_range(start_date: str, end_date: str, max_days: int = 31) -> list:
+    """start_date..end_date（含两端）的日期列表；日期缺失或格式不对时返回空列表"""
+    try:
+        start = date.fromisoformat(start_date) if start_date else None
+        end = date.fromisoformat(end_date) if end_date else start
+    except ValueError:
+        return []
+    if start is None or end < start:
+        return [start.isoformat()] if start else []
+    return [(start + timedelta(days=i)).isoformat() for i in range(min((end - start).days + 1, max_days))]
+
+# 工具声明为 async，等待高德响应时不会阻塞 MCP 服务进程处理其他调用
 @mcp.tool()
-def amap_hotel_search(city: str, keywords: str = "酒店", radius: int = 3000) -> str:
+@cached_tool
+async def amap_hotel_search(city: str, keywords: str = "酒店", radius: int = 3000) -> str:
     """
     搜索指定城市内的酒店信息。
     :param city: 城市名称或城市编码，如 '杭州'
@@ -94,7 +289,7 @@ def amap_hotel_search(city: str, keywords: str = "酒店", radius: int = 3000) -
     """
     # 使用高德地点搜索 API (周边搜索或关键字搜索)
     # 这里采用 text 接口，并限定 POI 类型为酒店住宿 (100000)
-    url = "https://restapi.amap.com/v3/place/text"
+    url = f"{AMAP_BASE_URL}/v3/place/text"
     params = {
         "keywords": keywords,
         "city": city,
@@ -105,19 +300,17 @@ def amap_hotel_search(city: str, keywords: str = "酒店", radius: int = 3000) -
     }
 
     # 调用通用的请求处理函数
-    data = _make_request(url, params)
-
-    # 逻辑处理：如果是字符串，说明 _make_request 报错（如 KEY 缺失）
-    if isinstance(data, str):
-        return data
+    data = await _make_request(url, params)
 
     if data.get("status") == "1":
         pois = data.get("pois", [])
+        poi_index.add_pois(pois, keywords)
         if not pois:
             return f"在 {city} 未找到相关的酒店信息。"
         
         results = [f"已为您在 {city} 找到以下酒店："]
-        for i, p in enumerate(pois[:3], 1):  # 取前3个最相关的
+        top = pois[:3]  # 取前3个最相关的
+        for i, p in enumerate(top, 1):
             biz_ext = p.get("biz_ext", {})
             rating = biz_ext.get("rating", "暂无评分")
             cost = biz_ext.get("cost", "暂无价格")
@@ -125,7 +318,7 @@ def amap_hotel_search(city: str, keywords: str = "酒店", radius: int = 3000) -
                     f"均价: {cost}元, 地址: {p['address']}")
             results.append(info)
             
-        return "\n".join(results)
+        return _typed("\n".join(results), top)
     
     return f"酒店查询失败：{data.get('info', '未知错误')}"
 
@@ -133,7 +326,8 @@ def amap_hotel_search(city: str, keywords: str = "酒店", radius: int = 3000) -
 # amap_mcp_service.py 补充部分
 
 @mcp.tool()
-def amap_maps_direction(origin: str, destination: str, mode: str = "driving") -> str:
+@cached_tool
+async def amap_maps_direction(origin: str, destination: str, mode: str = "driving") -> str:
     """
     路径规划：获取起点到终点的路线、距离和耗时。
     :param origin: 起点经纬度 (如 '116.481,39.990')
@@ -142,14 +336,14 @@ def amap_maps_direction(origin: str, destination: str, mode: str = "driving") ->
     """
     # 映射高德不同的接口 URL
     mode_map = {
-        "driving": "https://restapi.amap.com/v3/direction/driving",
-        "walking": "https://restapi.amap.com/v3/direction/walking",
-        "bicycling": "https://restapi.amap.com/v4/direction/bicycling"
+        "driving": f"{AMAP_BASE_URL}/v3/direction/driving",
+        "walking": f"{AMAP_BASE_URL}/v3/direction/walking",
+        "bicycling": f"{AMAP_BASE_URL}/v4/direction/bicycling"
     }
     url = mode_map.get(mode, mode_map["driving"])
     params = {"origin": origin, "destination": destination}
     
-    data = _make_request(url, params)
+    data = await _make_request(url, params)
     
     # 驾车/步行在 v3，骑行在 v4，结构略有不同
     try:
@@ -158,62 +352,124 @@ def amap_maps_direction(origin: str, destination: str, mode: str = "driving") ->
             path = route.get("paths", [{}])[0] if "paths" in route else route
             distance = int(path.get("distance", 0)) / 1000
             duration = int(path.get("duration", 0)) // 60
-            return f"路线规划成功：全长约 {distance:.2f}km，预计耗时 {duration} 分钟。"
+            return _typed(f"路线规划成功：全长约 {distance:.2f}km，预计耗时 {duration} 分钟。",
+                          data={"distance_m": int(distance * 1000), "duration_min": duration})
         return f"路径规划失败: {data.get('info') or data.get('errmsg')}"
     except:
         return "解析路径数据失败。"
 
 @mcp.tool()
-def amap_maps_poi_detail(poi_id: str) -> str:
+@cached_tool
+async def amap_route_matrix(locations: str, mode: str = "driving") -> str:
+    """
+    批量距离矩阵：一次性计算多个地点两两之间的路程距离与耗时。
+    :param locations: 经纬度列表，用 '|' 分隔，如 '116.397,39.916|116.391,39.906|116.403,39.924'
+    :param mode: driving(驾车), walking(步行), straight(直线距离)
+    :return: JSON 字符串 {"locations": [...], "distance_m": [[...]], "duration_s": [[...]]}
+    """
+    points = [p.strip() for p in locations.split("|") if p.strip()]
+    if len(points) < 2:
+        return "至少需要两个地点。"
+    if len(points) > 30:
+        return "地点数量过多（最多 30 个）。"
+    # 高德距离测量接口：多个起点到一个终点，按终点并发请求
+    type_map = {"straight": 0, "driving": 1, "walking": 3}
+    url = f"{AMAP_BASE_URL}/v3/distance"
+
+    async def column(dest: str):
+        params = {"origins": "|".join(points), "destination": dest, "type": type_map.get(mode, 1)}
+        return await _make_request(url, params)
+
+    columns = await asyncio.gather(*(column(dest) for dest in points))
+    n = len(points)
+    distance = [[0] * n for _ in range(n)]
+    duration = [[0] * n for _ in range(n)]
+    for j, data in enumerate(columns):
+        if data.get("status") != "1":
+            return f"距离矩阵计算失败: {data.get('info')}"
+        for r in data.get("results", []):
+            i = int(r["origin_id"]) - 1
+            distance[i][j] = int(r.get("distance", 0))
+            duration[i][j] = int(r.get("duration", 0) or 0)
+    return json.dumps({"locations": points, "distance_m": distance, "duration_s": duration})
+
+@mcp.tool()
+@cached_tool
+async def amap_maps_poi_detail(poi_id: str) -> str:
     """
     获取 POI 的详细信息（如电话、评分、深度详情等）。
     :param poi_id: 地点的 ID
     """
-    url = "https://restapi.amap.com/v3/place/detail"
+    url = f"{AMAP_BASE_URL}/v3/place/detail"
     params = {"id": poi_id}
-    data = _make_request(url, params)
+    data = await _make_request(url, params)
     
     if data.get("status") == "1":
         pois = data.get("pois", [])
         if not pois: return "未找到该地点的详细信息。"
+        poi_index.add_pois(pois)
         p = pois[0]
         biz_info = p.get("biz_ext", {})
         rating = biz_info.get("rating", "暂无评分")
         cost = biz_info.get("cost", "暂无")
-        return f"【{p['name']}】 评分: {rating}, 人均消费: {cost}, 地址: {p['address']}, 电话: {p.get('tel', '无')}"
+        return _typed(f"【{p['name']}】 评分: {rating}, 人均消费: {cost}, 地址: {p['address']}, 电话: {p.get('tel', '无')}",
+                      pois[:1])
     return f"详情查询失败: {data.get('info')}"
 
 
 @mcp.tool()
-def search_nearby(location: str, keyword: str, radius: int = 3000) -> str:
+@cached_tool
+async def search_nearby(location: str, keyword: str, radius: int = 3000) -> str:
     """
     在指定坐标周边搜索特定类型的场所。
     :param location: 中心点经纬度，格式 "经度,纬度"
     :param keyword: 搜索关键词，如 "酒店" 或 "餐厅"
     :param radius: 搜索半径，单位米，默认3000米
     """
-    url = "https://restapi.amap.com/v3/place/around"
-    params = {
-        "key": AMAP_API_KEY,
-        "location": location,
-        "keywords": keyword,
-        "radius": radius,
-        "offset": 5, # 仅返回前5个最相关的
-        "page": 1,
-        "extensions": "all"
-    }
-    
-    # 💡 关键部分：使用 location 参数进行精确的“周边”过滤
-    response = requests.get(url, params=params)
-    data = response.json()
-    
-    if data.get("status") == "1" and data.get("pois"):
+    center = parse_location(location)
+    # 该范围内的网格都被同一关键词的周边搜索覆盖过且未过期时，直接查本地索引
+    local = poi_index.nearby(center[0], center[1], radius, keyword) if center else None
+    if local is not None:
+        pois = local
+    else:
+        url = f"{AMAP_BASE_URL}/v3/place/around"
+        params = {
+            "location": location,
+            "keywords": keyword,
+            "radius": radius,
+            "offset": NEARBY_FETCH_SIZE,
+            "sortrule": "distance",
+            "page": 1,
+            "extensions": "all"
+        }
+
+        # 💡 关键部分：使用 location 参数进行精确的“周边”过滤
+        data = await _make_request(url, params)
+        if data.get("status") != "1":
+            return f"在坐标 {location} 周边 {radius}米内未找到相关{keyword}"
+        pois = data.get("pois", [])
+        poi_index.add_pois(pois, keyword)
+        if center:
+            # 结果被截断时，只有最远结果以内的范围算作完整覆盖
+            covered = radius if len(pois) < NEARBY_FETCH_SIZE else int(pois[-1].get("distance") or 0)
+            poi_index.mark_covered(center[0], center[1], covered, keyword)
+        pois = pois[:5]  # 仅返回前5个最近的
+
+    if pois:
         results = []
-        for poi in data["pois"]:
+        for poi in pois:
             results.append(f"{poi['name']} (距离中心: {poi['distance']}米, 地址: {poi['address']})")
-        return "\n".join(results)
+        return _typed("\n".join(results), pois)
     return f"在坐标 {location} 周边 {radius}米内未找到相关{keyword}"
 
+@mcp.tool()
+async def amap_cache_stats() -> str:
+    """
+    返回高德工具结果缓存与 POI 空间索引的命中统计（JSON 字符串），用于观察节省的配额与延迟。
+    """
+    return json.dumps(dict(tool_cache.stats(), poi_index=poi_index.stats(), forecast=forecast_cache.stats()),
+                      ensure_ascii=False)
+
 if __name__ == "__main__":
     # 启动 MCP 服务器，默认使用标准输入输出 (stdio) 通信
     # 重点：设置 dev_mode=False 并且关闭内置的日志装饰
@@ -0,0 +1,54 @@
+#-----------城市名 -> 高德 adcode 本地索引------------#
+# 随代码分发一份城市名到 adcode 的映射（直辖市、地级市/州/地区及常见县级市、旅游目的地），常驻内存。
+# 天气等接口改用 adcode 查询：不依赖高德对自由文本城市名的解析，“杭州”“杭州市”“杭州市西湖区”也落到同一个缓存键。
+# 只做确定的匹配：索引里没有的地名返回 None，由高德解析原始名称，绝不猜成另一个城市。
+import os
+import re
+import json
+from typing import Dict, Optional
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "city_adcode.json")
+
+_ADCODE = re.compile(r"^\d{6}$")
+# 已知城市名之后允许出现的地级行政区划后缀（其后可再跟下级区县，如“杭州市西湖区”）
+_CITY_LEVEL = re.compile(r"^(?:市|地区|盟|特别行政区|(?:[一-龥]{1,6}?族)*自治州)")
+# 县级后缀：只有索引中的名称本身是县级单位时才接受（“朝阳区”不是地级市“朝阳”）
+_COUNTY_LEVEL = re.compile(r"^(?:县|区|(?:[一-龥]{1,6}?族)*自治县)$")
+
+
+def is_county_level(adcode: str) -> bool:
+    return not adcode.endswith("00")
+
+
+class CityIndex:
+    """城市名到 adcode 的内存索引：精确匹配 -> 已知城市名 + 行政区划后缀"""
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        with open(path, encoding="utf-8") as f:
+            self._codes: Dict[str, str] = json.load(f)
+        self._names = {code: name for name, code in self._codes.items()}
+        # 前缀匹配时较长的名称优先
+        self._by_length = sorted(self._codes, key=len, reverse=True)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def name_of(self, adcode: str) -> Optional[str]:
+        return self._names.get(adcode)
+
+    def resolve(self, city: str) -> Optional[str]:
+        """返回 adcode；无法确定时返回 None，由调用方退回到原始城市名"""
+        raw = re.sub(r"\s+", "", city or "")
+        if not raw:
+            return None
+        if _ADCODE.match(raw):
+            return raw
+        if raw in self._codes:
+            return self._codes[raw]
+        for known in self._by_length:
+            if not raw.startswith(known):
+                continue
+            code = self._codes[known]
+            rest = raw[len(known):]
+            if _CITY_LEVEL.match(rest) or (_COUNTY_LEVEL.match(rest) and is_county_level(code)):
+                return code
+        return None
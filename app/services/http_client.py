@@ -0,0 +1,71 @@
+"""MCP 服务端共享的异步 HTTP 客户端：持久连接 + 有限次重试"""
+
+import os
+import asyncio
+import logging
+from typing import Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 需要重试的 HTTP 状态码（限流与服务端临时错误）
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class AsyncHTTPClient:
+    """
+    对 httpx.AsyncClient 的轻量封装。
+    同一服务进程内的所有工具共享一个实例，复用 keep-alive 连接；
+    网络异常和可重试状态码按指数退避最多重试 retries 次。
+    """
+    def __init__(self, timeout: float = None, max_connections: int = None,
+                 max_keepalive: int = None, retries: int = None, backoff: float = 0.3,
+                 headers: Optional[dict] = None):
+        self.timeout = timeout or float(os.getenv("MCP_HTTP_TIMEOUT", "10"))
+        self.max_connections = max_connections or int(os.getenv("MCP_HTTP_MAX_CONNECTIONS", "50"))
+        self.max_keepalive = max_keepalive or int(os.getenv("MCP_HTTP_MAX_KEEPALIVE", "20"))
+        self.retries = retries if retries is not None else int(os.getenv("MCP_HTTP_RETRIES", "2"))
+        self.backoff = backoff
+        self.headers = headers or {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # 懒加载：在 MCP 服务的事件循环中首次使用时才创建
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_keepalive),
+                headers=self.headers,
+            )
+        return self._client
+
+    async def get_json(self, url: str, params: Optional[dict] = None,
+                       headers: Optional[dict] = None) -> dict:
+        """发起 GET 请求并返回 JSON；超过重试次数后抛出最后一次的异常"""
+        # 去掉值为 None 的参数，避免被编码成字符串 "None"
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        last_error: Exception = None
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.get(url, params=params, headers=headers)
+                if response.status_code in RETRY_STATUS and attempt < self.retries:
+                    last_error = httpx.HTTPStatusError(
+                        f"HTTP {response.status_code}", request=response.request, response=response)
+                else:
+                    return response.json()
+            except (httpx.TransportError, ValueError) as e:
+                # TransportError 覆盖超时、连接失败；ValueError 为响应体非 JSON
+                last_error = e
+                if attempt >= self.retries:
+                    break
+            delay = self.backoff * (2 ** attempt)
+            logger.warning(f"请求 {url} 失败（第 {attempt + 1} 次）: {last_error}，{delay:.1f}s 后重试")
+            await asyncio.sleep(delay)
+        raise last_error
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
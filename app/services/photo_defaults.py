@@ -0,0 +1,4 @@
+"""配图相关的公共常量：API 进程与 Unsplash MCP 服务进程共用，不引入 MCP 服务模块本身"""
+
+# 搜不到图片时返回的通用旅行占位图
+PLACEHOLDER_PHOTO_URL = "https://images.unsplash.com/photo-1488646953014-85cb44e25828?q=80&w=1000"
@@ -0,0 +1,287 @@
+#-----------高德 POI 网格空间索引------------#
+# 记录高德返回过的每个 POI（名称、类型、评分、人均、坐标），按经纬度网格分桶；
+# 周边搜索覆盖过且未过期的网格可直接在本地回答，冷网格才回源高德。
+import json
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from cache.ttl_cache import open_sqlite
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def parse_location(location: str) -> Optional[Tuple[float, float]]:
+    """'经度,纬度' -> (lon, lat)，格式不对返回 None"""
+    try:
+        lon, lat = (float(x) for x in str(location).split(",")[:2])
+        return lon, lat
+    except (TypeError, ValueError):
+        return None
+
+
+def _biz_value(value) -> str:
+    # 高德缺省字段会返回空列表 []
+    return "" if value in (None, [], "") else str(value)
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(_biz_value(value))
+    except ValueError:
+        return None
+
+
+def poi_record(poi: dict) -> Optional[dict]:
+    """
+    把高德原始 POI（location 为 '经度,纬度'）或索引中的记录（lon / lat）转换为统一的机器可读记录：
+    {id, name, address, type, lon, lat, rating, cost[, distance]}，评分与人均缺省时为 None。
+    没有坐标的 POI 返回 None。
+    """
+    if "lon" in poi and "lat" in poi:
+        loc = (poi["lon"], poi["lat"])
+    else:
+        loc = parse_location(poi.get("location"))
+    if loc is None:
+        return None
+    biz = poi.get("biz_ext") or {}
+    record = {
+        "id": poi.get("id", ""),
+        "name": poi.get("name", ""),
+        "address": _biz_value(poi.get("address")),
+        "type": _biz_value(poi.get("type")),
+        "lon": loc[0],
+        "lat": loc[1],
+        "rating": _number(biz.get("rating", poi.get("rating"))),
+        "cost": _number(biz.get("cost", poi.get("cost"))),
+    }
+    if poi.get("distance") not in (None, "", []):
+        record["distance"] = int(float(poi["distance"]))
+    return record
+
+
+class POIIndex:
+    """
+    网格空间索引：cell_size 为网格边长（度，默认 0.01° ≈ 1km）。
+    - 内存中按网格 LRU 保留至多 max_cells 个网格，淘汰的网格仍在 SQLite 中，查询时按需回填。
+    - 每次成功的周边搜索记为一个覆盖圆 (经度, 纬度, 半径, 关键词, 时间)，登记到它触及的网格；
+      新查询的圆被某个未过期、同关键词的覆盖圆完全包含时，才在本地回答。
+    """
+    MAX_COVER_RADIUS = 5000   # 更大的覆盖圆按此半径登记，避免触及过多网格
+    MAX_COVERS_PER_CELL = 16
+
+    def __init__(self, cell_size: float = 0.01, max_cells: int = 2048, ttl: float = 7 * 24 * 3600,
+                 db_path: Optional[str] = None):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.ttl = ttl
+        self._cells: "OrderedDict[Tuple[int, int], Dict[str, dict]]" = OrderedDict()
+        self._coverage: Dict[Tuple[int, int], List[tuple]] = {}  # 网格 -> [(lon, lat, radius, keyword, fetched_at)]
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.cold_misses = 0
+        self.evictions = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = open_sqlite(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS poi_index ("
+                " id TEXT PRIMARY KEY, cx INTEGER NOT NULL, cy INTEGER NOT NULL, data TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS poi_index_cell ON poi_index (cx, cy)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS poi_coverage ("
+                " lon REAL NOT NULL, lat REAL NOT NULL, radius REAL NOT NULL, keyword TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL, PRIMARY KEY (lon, lat, radius, keyword))"
+            )
+            cutoff = time.time() - ttl
+            self._db.execute("DELETE FROM poi_coverage WHERE fetched_at <= ?", (cutoff,))
+            self._db.commit()
+            for row in self._db.execute("SELECT lon, lat, radius, keyword, fetched_at FROM poi_coverage"):
+                self._register_cover(tuple(row))
+
+    # ---------- 网格 ----------
+    def cell_of(self, lon: float, lat: float) -> Tuple[int, int]:
+        return math.floor(lon / self.cell_size), math.floor(lat / self.cell_size)
+
+    def cells_in_radius(self, lon: float, lat: float, radius: float) -> List[Tuple[int, int]]:
+        """圆的外接矩形触及的所有网格"""
+        dlat = radius / 111_320
+        dlon = radius / (111_320 * max(math.cos(math.radians(lat)), 1e-6))
+        (x0, y0), (x1, y1) = self.cell_of(lon - dlon, lat - dlat), self.cell_of(lon + dlon, lat + dlat)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def _cell(self, cell: Tuple[int, int]) -> Dict[str, dict]:
+        """取网格（必要时从磁盘回填），并维护 LRU；调用方需持有锁"""
+        pois = self._cells.get(cell)
+        if pois is None:
+            pois = {}
+            if self._db is not None:
+                for poi_id, data in self._db.execute(
+                        "SELECT id, data FROM poi_index WHERE cx = ? AND cy = ?", cell):
+                    pois[poi_id] = json.loads(data)
+            self._cells[cell] = pois
+        self._cells.move_to_end(cell)
+        while len(self._cells) > self.max_cells:
+            evicted, _ = self._cells.popitem(last=False)
+            self.evictions += 1
+            if self._db is None:
+                # 没有磁盘层时被淘汰网格的 POI 就丢失了：覆盖它的记录随之作废，否则会在本地答出空结果
+                self._drop_covers(evicted)
+        return pois
+
+    def _peek(self, cell: Tuple[int, int]) -> Dict[str, dict]:
+        """只读地取网格：不插入空网格、不参与 LRU，避免查询把有数据的网格挤出内存；调用方需持有锁"""
+        pois = self._cells.get(cell)
+        if pois is not None:
+            return pois
+        if self._db is None:
+            return {}
+        return {poi_id: json.loads(data) for poi_id, data in self._db.execute(
+            "SELECT id, data FROM poi_index WHERE cx = ? AND cy = ?", cell)}
+
+    def _drop_covers(self, cell: Tuple[int, int]):
+        """作废所有触及该网格的覆盖记录；调用方需持有锁"""
+        for cover in self._coverage.pop(cell, []):
+            for other in self.cells_in_radius(cover[0], cover[1], cover[2]):
+                covers = self._coverage.get(other)
+                if covers and cover in covers:
+                    covers.remove(cover)
+                    if not covers:
+                        del self._coverage[other]
+
+    # ---------- 写入 ----------
+    def add_pois(self, pois: Iterable[dict], keyword: Optional[str] = None):
+        """写入高德返回的原始 POI；keyword 为本次搜索词，会记为 POI 的标签"""
+        rows = []
+        with self._lock:
+            for p in pois:
+                loc = parse_location(p.get("location"))
+                if not p.get("id") or loc is None:
+                    continue
+                biz = p.get("biz_ext") or {}
+                cell = self.cell_of(*loc)
+                bucket = self._cell(cell)
+                record = bucket.get(p["id"]) or {"id": p["id"], "tags": []}
+                record.update({
+                    "name": p.get("name", ""),
+                    "type": _biz_value(p.get("type")),
+                    "address": _biz_value(p.get("address")),
+                    "rating": _biz_value(biz.get("rating")) or record.get("rating", ""),
+                    "cost": _biz_value(biz.get("cost")) or record.get("cost", ""),
+                    "lon": loc[0],
+                    "lat": loc[1],
+                })
+                if keyword and keyword not in record["tags"]:
+                    record["tags"].append(keyword)
+                bucket[p["id"]] = record
+                rows.append((p["id"], cell[0], cell[1], json.dumps(record, ensure_ascii=False)))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO poi_index (id, cx, cy, data) VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def mark_covered(self, lon: float, lat: float, radius: float, keyword: str):
+        """记录一次成功的周边搜索：该圆内同关键词的 POI 已全部写入索引"""
+        cover = (lon, lat, min(radius, self.MAX_COVER_RADIUS), keyword, time.time())
+        with self._lock:
+            self._register_cover(cover)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO poi_coverage (lon, lat, radius, keyword, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    cover)
+                self._db.commit()
+
+    def _register_cover(self, cover: tuple):
+        cutoff = time.time() - self.ttl
+        for cell in self.cells_in_radius(cover[0], cover[1], cover[2]):
+            covers = [c for c in self._coverage.get(cell, []) if c[4] > cutoff]
+            covers.append(cover)
+            self._coverage.pop(cell, None)  # 重新插入，使字典顺序即最近登记顺序
+            self._coverage[cell] = covers[-self.MAX_COVERS_PER_CELL:]
+        # 覆盖记录同样有上限：超出时丢弃最早登记的网格（只会导致这些网格重新回源）
+        while len(self._coverage) > self.max_cells * 4:
+            self._coverage.pop(next(iter(self._coverage)))
+
+    # ---------- 查询 ----------
+    def is_covered(self, lon: float, lat: float, radius: float, keyword: str) -> bool:
+        """查询圆是否被某个未过期的同关键词覆盖圆完全包含（覆盖圆必然触及查询圆心所在网格）"""
+        cutoff = time.time() - self.ttl
+        for c_lon, c_lat, c_radius, c_keyword, fetched_at in self._coverage.get(self.cell_of(lon, lat), []):
+            if c_keyword == keyword and fetched_at > cutoff \
+                    and haversine_m(lon, lat, c_lon, c_lat) + radius <= c_radius:
+                return True
+        return self._covered_on_disk(lon, lat, radius, keyword, cutoff)
+
+    def _covered_on_disk(self, lon: float, lat: float, radius: float, keyword: str, cutoff: float) -> bool:
+        """
+        内存未覆盖时回查磁盘：共享同一数据库的其他进程可能已抓取过这片区域。
+        找到覆盖圆后登记到内存，并丢弃相关网格的内存副本，使其从磁盘重新加载对方写入的 POI。
+        """
+        if self._db is None or radius > self.MAX_COVER_RADIUS:
+            return False
+        dlat = self.MAX_COVER_RADIUS / 111_320
+        dlon = self.MAX_COVER_RADIUS / (111_320 * max(math.cos(math.radians(lat)), 1e-6))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT lon, lat, radius, keyword, fetched_at FROM poi_coverage"
+                " WHERE keyword = ? AND fetched_at > ? AND lon BETWEEN ? AND ? AND lat BETWEEN ? AND ?",
+                (keyword, cutoff, lon - dlon, lon + dlon, lat - dlat, lat + dlat)).fetchall()
+            for row in rows:
+                if haversine_m(lon, lat, row[0], row[1]) + radius <= row[2]:
+                    self._register_cover(tuple(row))
+                    for cell in self.cells_in_radius(row[0], row[1], row[2]):
+                        self._cells.pop(cell, None)
+                    return True
+        return False
+
+    def nearby(self, lon: float, lat: float, radius: float, keyword: str, limit: int = 5) -> Optional[List[dict]]:
+        """
+        覆盖新鲜时在本地回答周边搜索：返回按距离排序的 POI（含 distance 字段）；
+        查询范围未被覆盖或覆盖已过期时返回 None，调用方应回源高德。
+        """
+        if not self.is_covered(lon, lat, radius, keyword):
+            self.cold_misses += 1
+            return None
+        results = []
+        with self._lock:
+            for cell in self.cells_in_radius(lon, lat, radius):
+                for p in self._peek(cell).values():
+                    if not self._matches(p, keyword):
+                        continue
+                    d = haversine_m(lon, lat, p["lon"], p["lat"])
+                    if d <= radius:
+                        results.append(dict(p, distance=int(d)))
+        self.local_hits += 1
+        results.sort(key=lambda p: p["distance"])
+        return results[:limit]
+
+    @staticmethod
+    def _matches(poi: dict, keyword: str) -> bool:
+        return keyword in poi.get("tags", []) or keyword in poi.get("name", "") or keyword in poi.get("type", "")
+
+    def stats(self) -> dict:
+        return {
+            "cells_in_memory": len(self._cells),
+            "max_cells": self.max_cells,
+            "pois_in_memory": sum(len(c) for c in self._cells.values()),
+            "covered_cells": len(self._coverage),
+            "covers": len({c for covers in self._coverage.values() for c in covers}),
+            "local_hits": self.local_hits,
+            "cold_misses": self.cold_misses,
+            "evictions": self.evictions,
+            "persistent": self._db is not None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
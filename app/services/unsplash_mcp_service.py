@@ -1,36 +1,44 @@
 
 """Unsplash图片服务"""
 
-import requests
 import os
+import sys
 from typing import List, Optional
 from fastmcp import FastMCP
 
+# 以脚本方式启动时，把 app 目录加入模块搜索路径，便于复用公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.http_client import AsyncHTTPClient
+from services.photo_defaults import PLACEHOLDER_PHOTO_URL
+
 mcp = FastMCP("VisualService")
 
 # 从环境变量获取 Unsplash Access Key
 UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
+# Unsplash API 地址，压测时可指向本地模拟服务
+UNSPLASH_BASE_URL = os.getenv("UNSPLASH_BASE_URL", "https://api.unsplash.com").rstrip("/")
+
+# 进程内共享的 HTTP 客户端，鉴权头在创建时统一设置
+http_client = AsyncHTTPClient(headers={"Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"})
 
-def _make_unsplash_request(url, params):
+async def _make_unsplash_request(url, params):
     """通用 Unsplash 请求处理"""
     if not UNSPLASH_ACCESS_KEY:
         return {"error": "未配置 UNSPLASH_ACCESS_KEY"}
     
-    headers = {"Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"}
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        return response.json()
+        return await http_client.get_json(url, params=params)
     except Exception as e:
         return {"error": f"网络请求异常: {str(e)}"}
 
 @mcp.tool()
-def get_poi_photo(name: str) -> str:
+async def get_poi_photo(name: str) -> str:
     """
     根据地点名称搜索高清风景图。
     :param location_name: 地点或景点名称，如 'Forbidden City' 或 '故宫'
     :return: 图片的 URL 地址
     """
-    url = "https://api.unsplash.com/search/photos"
+    url = f"{UNSPLASH_BASE_URL}/search/photos"
     # 建议加上 'travel' 或 'scenery' 关键词以获得更相关的结果
     params = {
         "query": f"{name}",
@@ -38,14 +46,14 @@ def get_poi_photo(name: str) -> str:
         "orientation": "landscape"
     }
     
-    data = _make_unsplash_request(url, params)
+    data = await _make_unsplash_request(url, params)
     
     if "results" in data and len(data["results"]) > 0:
         # 返回 raw 或 regular 尺寸的 URL
         return data["results"][0]["urls"]["regular"]
     
     # 如果没搜到具体景点，返回一张通用的旅行占位图
-    return "https://images.unsplash.com/photo-1488646953014-85cb44e25828?q=80&w=1000"
+    return PLACEHOLDER_PHOTO_URL
 
 if __name__ == "__main__":
     mcp.run(transport="stdio")
\ No newline at end of file
@@ -0,0 +1,177 @@
+#==================阶段调度器（Stage DAG）=====================#
+# 把编排流程描述为“阶段 + 声明的输入/输出”，调度器根据依赖关系以最大并行度执行，
+# 并在结束后给出每个阶段的耗时以及整条请求的关键路径。
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from metrics import span, STAGE_SECONDS
+
+
+class Stage:
+    """一个编排阶段：声明需要的输入键和产出的输出键"""
+    def __init__(self, name: str, func: Callable[..., Awaitable[Any]],
+                 inputs: Optional[List[str]] = None, outputs: Optional[List[str]] = None):
+        self.name = name
+        self.func = func            # async 函数，按关键字接收 inputs
+        self.inputs = inputs or []
+        self.outputs = outputs or [name]
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name}: {self.inputs} -> {self.outputs})"
+
+
+class StageTiming:
+    """单个阶段的计时（相对调度开始时刻，单位秒）"""
+    def __init__(self, name: str, start: float, end: float):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class ScheduleReport:
+    """一次调度的执行报告"""
+    def __init__(self, timings: Dict[str, StageTiming], critical_path: List[str],
+                 critical_path_time: float, wall_time: float):
+        self.timings = timings
+        self.critical_path = critical_path
+        self.critical_path_time = critical_path_time
+        self.wall_time = wall_time
+
+    def server_timing(self) -> str:
+        """生成 HTTP Server-Timing 头，浏览器开发者工具可直接展示"""
+        parts = [f"{name};dur={t.duration * 1000:.0f}" for name, t in self.timings.items()]
+        parts.append(f"critical_path;dur={self.critical_path_time * 1000:.0f}")
+        parts.append(f"total;dur={self.wall_time * 1000:.0f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        stages = ", ".join(f"{n}={t.duration:.2f}s" for n, t in self.timings.items())
+        return (f"关键路径 {' -> '.join(self.critical_path)} 耗时 {self.critical_path_time:.2f}s，"
+                f"总耗时 {self.wall_time:.2f}s（{stages}）")
+
+
+class StageScheduler:
+    """按依赖关系并发执行 Stage 的调度器"""
+    def __init__(self, stages: List[Stage]):
+        self.stages = {s.name: s for s in stages}
+        # 输出键 -> 产出它的阶段
+        self.producers: Dict[str, str] = {}
+        for s in stages:
+            for key in s.outputs:
+                if key in self.producers:
+                    raise ValueError(f"输出 '{key}' 被多个阶段声明: {self.producers[key]}, {s.name}")
+                self.producers[key] = s.name
+        self._check_acyclic()
+
+    def dependencies(self, stage: Stage) -> List[str]:
+        """阶段依赖的上游阶段（初始上下文提供的键不算依赖）"""
+        return sorted({self.producers[k] for k in stage.inputs if k in self.producers})
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"阶段依赖存在环: {name}")
+            visiting.add(name)
+            for dep in self.dependencies(self.stages[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self, context: Dict[str, Any],
+                  on_event: Optional[Callable[[str, str, Any], Awaitable[None]]] = None) -> ScheduleReport:
+        """
+        执行所有阶段，结果写回 context。
+        on_event(event, stage_name, payload) 会在阶段开始/结束时被调用（可选）。
+        """
+        for s in self.stages.values():
+            missing = [k for k in s.inputs if k not in self.producers and k not in context]
+            if missing:
+                raise ValueError(f"阶段 {s.name} 缺少输入: {missing}")
+
+        t0 = time.perf_counter()
+        timings: Dict[str, StageTiming] = {}
+        pending = dict(self.stages)
+        running: Dict[asyncio.Task, str] = {}
+        starts: Dict[str, float] = {}
+
+        async def emit(event: str, name: str, payload: Any = None):
+            if on_event:
+                await on_event(event, name, payload)
+
+        try:
+            while pending or running:
+                # 启动所有输入已就绪的阶段
+                ready = [n for n, s in pending.items() if all(k in context for k in s.inputs)]
+                for name in ready:
+                    stage = pending.pop(name)
+                    starts[name] = time.perf_counter() - t0
+                    await emit("stage_start", name)
+                    kwargs = {k: context[k] for k in stage.inputs}
+                    running[asyncio.create_task(self._run_stage(stage, kwargs))] = name
+
+                if not running:
+                    raise RuntimeError(f"以下阶段无法满足依赖: {list(pending)}")
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    stage = self.stages[name]
+                    result = task.result()  # 阶段异常直接向上抛出
+                    if len(stage.outputs) == 1:
+                        context[stage.outputs[0]] = result
+                    else:
+                        for key in stage.outputs:
+                            context[key] = result[key]
+                    timings[name] = StageTiming(name, starts[name], time.perf_counter() - t0)
+                    await emit("stage_finish", name, result)
+        finally:
+            for task in running:
+                task.cancel()
+
+        wall_time = time.perf_counter() - t0
+        path, path_time = self._critical_path(timings)
+        return ScheduleReport(timings, path, path_time, wall_time)
+
+    @staticmethod
+    async def _run_stage(stage: Stage, kwargs: Dict[str, Any]) -> Any:
+        with span("stage", STAGE_SECONDS, stage=stage.name):
+            return await stage.func(**kwargs)
+
+    def _critical_path(self, timings: Dict[str, StageTiming]):
+        """按阶段自身耗时计算 DAG 最长路径，即决定端到端延迟的那条链"""
+        finish: Dict[str, float] = {}
+        prev: Dict[str, Optional[str]] = {}
+
+        def earliest_finish(name: str) -> float:
+            if name in finish:
+                return finish[name]
+            deps = self.dependencies(self.stages[name])
+            best, best_dep = 0.0, None
+            for d in deps:
+                f = earliest_finish(d)
+                if f > best:
+                    best, best_dep = f, d
+            finish[name] = best + timings[name].duration
+            prev[name] = best_dep
+            return finish[name]
+
+        if not timings:
+            return [], 0.0
+        last = max(timings, key=earliest_finish)
+        path = []
+        node: Optional[str] = last
+        while node:
+            path.append(node)
+            node = prev[node]
+        return list(reversed(path)), finish[last]
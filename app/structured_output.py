@@ -0,0 +1,330 @@
+#-----------结构化输出的提取与修复------------#
+# LLM 返回的 JSON 解析或校验失败时，按代价从低到高逐级修复，而不是让整个规划流程重跑：
+#   1. 括号配平提取顶层 JSON 对象（替代贪婪的 \{.*\}，不会被说明文字里的花括号带偏）
+#   2. 本地修正常见错误：带单位的数字字符串、写成字符串的坐标、缺失的 day_index 等
+#   3. 仍不合法时，只把出错字段的路径、错误信息与所在片段发回 LLM，要求返回修正后的片段
+# 第 3 步受重试预算限制，预算用完仍失败时抛出 ValueError。
+import re
+import json
+import inspect
+import functools
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin
+from pydantic import BaseModel, ValidationError
+from metrics import STRUCTURED_REPAIRS
+
+T = TypeVar("T", bound=BaseModel)
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_FREE = ("免费", "free", "无")
+
+
+def _balanced_spans(text: str):
+    """依次产出文本中每个括号配平的 {...} 片段（忽略字符串内的括号）"""
+    start = text.find("{")
+    while start != -1:
+        depth, in_string, escape = 0, False, False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    yield text[start:i + 1]
+                    break
+        else:
+            return  # 直到文本结束都未闭合（输出被截断），后面不会再有完整对象
+        start = text.find("{", i + 1)
+
+
+def extract_json_object(text: str) -> Optional[Any]:
+    """
+    提取文本中第一个可解析的顶层 JSON 对象；Markdown 围栏与前后说明文字会被跳过。
+    直接解析失败时再尝试去掉尾随逗号。找不到时返回 None。
+    """
+    for fragment in _balanced_spans(text):
+        for candidate in (fragment, _TRAILING_COMMA.sub(r"\1", fragment)):
+            try:
+                data = json.loads(candidate, strict=False)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+    return None
+
+
+def _unwrap_optional(annotation) -> Tuple[Any, bool]:
+    """Optional[X] -> (X, True)"""
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return annotation, False
+
+
+def _is_model(annotation) -> bool:
+    return inspect.isclass(annotation) and issubclass(annotation, BaseModel)
+
+
+def _to_int(value: str) -> Optional[int]:
+    """'120分钟' -> 120，'¥50元' -> 50，'16~20℃' -> 16，'免费' -> 0"""
+    if any(w in value.lower() for w in _FREE) and not _NUMBER.search(value):
+        return 0
+    match = _NUMBER.search(value.replace(",", ""))
+    return int(float(match.group())) if match else None
+
+
+def _to_location(value: str) -> Optional[Dict[str, float]]:
+    """'120.15,30.27' -> {"longitude": 120.15, "latitude": 30.27}"""
+    numbers = _NUMBER.findall(value)
+    if len(numbers) != 2:
+        return None
+    lon, lat = float(numbers[0]), float(numbers[1])
+    if abs(lat) > 90 >= abs(lon):  # 经纬度写反
+        lon, lat = lat, lon
+    return {"longitude": lon, "latitude": lat}
+
+
+def _fix_value(value: Any, annotation, optional: bool) -> Tuple[Any, bool]:
+    """按字段注解修正一个值，返回 (新值, 是否改动)"""
+    annotation, is_optional = _unwrap_optional(annotation)
+    optional = optional or is_optional
+    if value is None:
+        return value, False
+    if get_origin(annotation) in (list, List) and isinstance(value, list):
+        item_type = (get_args(annotation) or (Any,))[0]
+        changed = False
+        for i, item in enumerate(value):
+            if _is_model(item_type) and isinstance(item, dict):
+                changed |= _fix_model_dict(item, item_type, index=i)
+            else:
+                value[i], c = _fix_value(item, item_type, False)
+                changed |= c
+        return value, changed
+    if _is_model(annotation):
+        if isinstance(value, dict):
+            return value, _fix_model_dict(value, annotation)
+        if isinstance(value, str):
+            if "longitude" in annotation.model_fields:
+                location = _to_location(value)
+                if location is not None:
+                    return location, True
+            if optional:
+                # 可选的对象字段被写成了描述文字（如 Meal.location="西湖边"）：置空而不是整体失败
+                return None, True
+        return value, False
+    if annotation is int:
+        if isinstance(value, str):
+            number = _to_int(value)
+            return (number, True) if number is not None else (value, False)
+        if isinstance(value, float):
+            return int(round(value)), True
+    if annotation is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value), True
+    return value, False
+
+
+def _fix_model_dict(data: Dict[str, Any], model: Type[BaseModel], index: Optional[int] = None) -> bool:
+    changed = False
+    for name, field in model.model_fields.items():
+        if name not in data:
+            # 列表元素缺少 day_index 时按位置补齐（从 1 开始）
+            if name == "day_index" and index is not None:
+                data[name] = index + 1
+                changed = True
+            continue
+        data[name], c = _fix_value(data[name], field.annotation, not field.is_required())
+        changed |= c
+    return changed
+
+
+def apply_local_fixes(data: Dict[str, Any], model: Type[BaseModel]) -> bool:
+    """就地修正 data 中的常见错误，返回是否有改动"""
+    return _fix_model_dict(data, model)
+
+
+def _get_path(data: Any, path: Tuple) -> Any:
+    for key in path:
+        data = data[key]
+    return data
+
+
+def _format_path(path: Tuple) -> str:
+    return ".".join(str(p) for p in path) or "$"
+
+
+def _parse_path(text: str) -> Tuple:
+    if text in ("", "$"):
+        return ()
+    return tuple(int(p) if p.isdigit() else p for p in text.split("."))
+
+
+def error_fragments(data: Dict[str, Any], error: ValidationError, limit: int = 8) -> List[Dict[str, Any]]:
+    """
+    把校验错误归并到出错字段所在的最小对象：每个片段包含对象路径、该对象的当前内容与其中的错误。
+    片段数超过 limit 时只取前 limit 个，剩下的留给下一轮修复。
+    """
+    fragments: Dict[Tuple, Dict[str, Any]] = {}
+    for err in error.errors():
+        loc = tuple(err["loc"])
+        # 定位到仍存在于数据中的、最近的 dict 作为片段
+        parent = loc[:-1]
+        while parent:
+            try:
+                if isinstance(_get_path(data, parent), dict):
+                    break
+            except (KeyError, IndexError, TypeError):
+                pass
+            parent = parent[:-1]
+        entry = fragments.setdefault(parent, {"path": _format_path(parent), "errors": []})
+        entry["errors"].append(f"{_format_path(loc[len(parent):])}: {err['msg']}")
+    result = []
+    for parent, entry in list(fragments.items())[:limit]:
+        fragment = _get_path(data, parent)
+        if not parent:
+            # 顶层字段出错时不发送整份数据，只带上标量字段，嵌套的列表/对象保持原样
+            fragment = {k: v for k, v in fragment.items() if not isinstance(v, (list, dict))}
+        entry["fragment"] = fragment
+        result.append(entry)
+    return result
+
+
+def build_repair_prompt(fragments: List[Dict[str, Any]], model: Type[BaseModel]) -> str:
+    parts = [
+        f"你之前输出的 {model.__name__} JSON 中以下片段未通过校验。",
+        "请逐个修正，只返回一个 JSON 对象：键为片段路径，值为修正后的片段（只需包含需要修改或补充的字段）；"
+        "不要输出其他内容。",
+    ]
+    for entry in fragments:
+        parts.append(
+            f"\n路径: {entry['path']}\n错误:\n" + "\n".join(f"  - {e}" for e in entry["errors"]) +
+            f"\n片段: {json.dumps(entry['fragment'], ensure_ascii=False)}"
+        )
+    return "\n".join(parts)
+
+
+def apply_repairs(data: Dict[str, Any], repairs: Dict[str, Any], fragments: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把 LLM 返回的修正片段合并回原数据；只接受本轮请求过的路径"""
+    allowed = {entry["path"] for entry in fragments}
+    for path_text, value in repairs.items():
+        if path_text not in allowed or not isinstance(value, dict):
+            continue
+        try:
+            _get_path(data, _parse_path(path_text)).update(value)
+        except (KeyError, IndexError, TypeError, AttributeError):
+            continue
+    return data
+
+
+class StructuredOutputParser:
+    """
+    把 LLM 原始回复解析为 Pydantic 模型，失败时按“提取 -> 本地修正 -> 局部重问”逐级修复。
+    max_repairs 为允许的局部重问次数（每次只发送出错片段，输出也只有片段）。
+    """
+    def __init__(self, llm: Any, max_repairs: int = 2, max_tokens: int = 4096):
+        self.llm = llm
+        self.max_repairs = max_repairs
+        self.max_tokens = max_tokens
+        self.attempts = 0  # 最近一次 parse 实际发起的 LLM 修复次数
+
+    async def parse(self, raw_response: str, model: Type[T]) -> T:
+        name = model.__name__
+        data = extract_json_object(raw_response)
+        self.attempts = 0
+        while data is None:
+            # 连完整的 JSON 对象都没有（截断或语法错误）：只能请 LLM 整段重写，同样计入预算
+            if self.attempts >= self.max_repairs:
+                STRUCTURED_REPAIRS.inc(model=name, kind="syntax", outcome="failed")
+                raise ValueError("AI 返回的内容中没有可解析的 JSON")
+            self.attempts += 1
+            data = extract_json_object(await self._ask(
+                "下面的 JSON 不完整或存在语法错误，请修正后只输出完整、合法的 JSON，不要输出其他内容：\n"
+                + raw_response))
+            STRUCTURED_REPAIRS.inc(model=name, kind="syntax", outcome="applied" if data is not None else "empty")
+
+        if apply_local_fixes(data, model):
+            STRUCTURED_REPAIRS.inc(model=name, kind="local", outcome="applied")
+        while True:
+            try:
+                return model.model_validate(data)
+            except ValidationError as e:
+                if self.attempts >= self.max_repairs:
+                    print(f"解析失败（已重试 {self.attempts} 次）: {e}")
+                    STRUCTURED_REPAIRS.inc(model=name, kind="llm", outcome="failed")
+                    raise ValueError("AI 返回的格式不符合预期模型") from e
+                self.attempts += 1
+                fragments = error_fragments(data, e)
+                print(f"🩹 结构化输出有 {e.error_count()} 处校验错误，请求 LLM 修正 {len(fragments)} 个片段"
+                      f"（第 {self.attempts}/{self.max_repairs} 次）")
+                repairs = extract_json_object(await self._ask(build_repair_prompt(fragments, model)))
+                if repairs:
+                    data = apply_repairs(data, repairs, fragments)
+                    apply_local_fixes(data, model)
+                STRUCTURED_REPAIRS.inc(model=name, kind="llm", outcome="applied" if repairs else "empty")
+
+    async def _ask(self, prompt: str) -> str:
+        response = await self.llm.generate_response(
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=self.max_tokens,
+            temperature=0,
+        )
+        return response.content or ""
+
+
+# ---------- 紧凑的输出结构描述 ----------
+_TYPE_NAMES = {str: "str", int: "int", float: "float", bool: "bool", dict: "object"}
+
+
+def _type_name(annotation, nested: List[Type[BaseModel]]) -> str:
+    annotation, _ = _unwrap_optional(annotation)
+    if get_origin(annotation) in (list, List):
+        item = (get_args(annotation) or (Any,))[0]
+        return f"{_type_name(item, nested)}[]"
+    if _is_model(annotation):
+        if annotation not in nested:
+            nested.append(annotation)
+        return annotation.__name__
+    return _TYPE_NAMES.get(annotation, getattr(annotation, "__name__", "any"))
+
+
+def _constraints(field) -> str:
+    bounds = {}
+    for meta in field.metadata:
+        for attr, symbol in (("ge", ">="), ("gt", ">"), ("le", "<="), ("lt", "<")):
+            if getattr(meta, attr, None) is not None:
+                bounds[symbol] = getattr(meta, attr)
+    return "".join(f" {k}{v:g}" for k, v in bounds.items())
+
+
+@functools.lru_cache(maxsize=None)
+def compact_schema(model: Type[BaseModel]) -> str:
+    """
+    把 Pydantic 模型渲染为紧凑的字段清单（每个模型只生成一次）：
+        TripPlan:
+          city: str  # 目的地城市
+          days: DayPlan[]  # 每日行程
+          budget?: Budget  # 总预算预估
+    ? 表示可省略，X[] 表示数组；与完整的 model_json_schema() 相比 token 数少得多，且内容固定，便于前缀缓存。
+    """
+    nested, lines, i = [model], [], 0
+    while i < len(nested):
+        current = nested[i]
+        lines.append(f"{current.__name__}:")
+        for name, field in current.model_fields.items():
+            optional = "" if field.is_required() else "?"
+            line = f"  {name}{optional}: {_type_name(field.annotation, nested)}{_constraints(field)}"
+            if field.description:
+                line += f"  # {field.description}"
+            lines.append(line)
+        i += 1
+    return "\n".join(lines)
@@ -2,12 +2,10 @@ import requests
 import json
 import time
 
-def test_travel_planner(query):
+def test_travel_planner(trip_request):
     url = "http://127.0.0.1:8000/api/plan"
-    # 注意：FastAPI 的 create_plan 接收的是 query 参数或 JSON 体
-    # 根据你 api.py 的定义: async def create_plan(user_query: str)
-    # 如果是路径参数或 Query 参数，采用以下格式：
-    params = {"user_query": query}
+    # /api/plan 接收 TripRequest JSON 请求体
+    query = f"{trip_request['city']} {trip_request['travel_days']}天"
     
     print(f"\n🚀 正在发送请求: {query}")
     print("-" * 50)
@@ -15,7 +13,7 @@ def test_travel_planner(query):
     start_time = time.time()
     try:
         # 发送 POST 请求
-        response = requests.post(url, params=params, timeout=120)
+        response = requests.post(url, json=trip_request, timeout=120)
         
         # 检查响应状态
         if response.status_code == 200:
@@ -34,11 +32,27 @@ def test_travel_planner(query):
 
 if __name__ == "__main__":
     # 测试用例 1：综合性需求（触发天气、酒店、景点多重工具）
-    case_1 = "我想去杭州玩，帮我看看下周天气，推荐一个西湖附近的酒店，并规划去灵隐寺的路线。"
+    case_1 = {
+        "city": "杭州",
+        "start_date": "2025-06-01",
+        "end_date": "2025-06-03",
+        "travel_days": 3,
+        "transportation": "公共交通",
+        "accommodation": "西湖附近的酒店",
+        "preferences": ["历史文化", "自然风光"],
+        "free_text_input": "希望安排灵隐寺",
+    }
     
     # 测试用例 2：简单需求
-    case_2 = "北京明天的天气怎么样？"
+    case_2 = {
+        "city": "北京",
+        "start_date": "2025-06-01",
+        "end_date": "2025-06-01",
+        "travel_days": 1,
+        "transportation": "公共交通",
+        "accommodation": "经济型酒店",
+    }
 
     test_travel_planner(case_1)
     # time.sleep(2) # 稍作停顿
-    # test_travel_planner(case_2)
\ No newline at end of file
+    # test_travel_planner(case_2)
@@ -0,0 +1,34 @@
+from services.poi_index import POIIndex
+
+
+def _poi(poi_id, lon, lat, name="测试酒店"):
+    return {"id": poi_id, "name": name, "type": "住宿服务;宾馆酒店", "address": "测试路1号",
+            "location": f"{lon},{lat}"}
+
+
+def test_nearby_after_eviction_falls_back_to_amap():
+    """无磁盘层时网格被 LRU 淘汰后，覆盖它的记录应作废，而不是在本地答出空结果"""
+    index = POIIndex(max_cells=10)
+    index.add_pois([_poi("A", 120.155, 30.274)], keyword="酒店")
+    index.mark_covered(120.155, 30.274, 3000, "酒店")
+    assert [p["id"] for p in index.nearby(120.155, 30.274, 1000, "酒店")] == ["A"]
+
+    # 远处写入 20 个网格的 POI，把上面的网格挤出内存
+    index.add_pois([_poi(f"B{i}", 121.0 + i * 0.05, 31.0) for i in range(20)], keyword="酒店")
+    assert index.nearby(120.155, 30.274, 1000, "酒店") is None
+
+
+def test_nearby_does_not_evict_populated_cells():
+    """查询半径内的空网格不应被插入内存、挤掉有数据的网格"""
+    index = POIIndex(max_cells=10)
+    index.add_pois([_poi("A", 120.155, 30.274)], keyword="酒店")
+    index.mark_covered(120.155, 30.274, 3000, "酒店")
+    for _ in range(3):
+        assert [p["id"] for p in index.nearby(120.155, 30.274, 3000, "酒店")] == ["A"]
+    assert index.evictions == 0
+
+
+if __name__ == "__main__":
+    test_nearby_after_eviction_falls_back_to_amap()
+    test_nearby_does_not_evict_populated_cells()
+    print("✅ POI 索引测试通过")
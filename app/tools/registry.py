@@ -5,6 +5,7 @@ class ToolRegistry:
     """工具注册表：负责工具的生命周期和格式转换"""
     def __init__(self):
         self._tools: Dict[str, Any] = {}
+        self._schemas: Optional[List[Dict]] = None  # 工具说明书缓存，注册新工具时失效
 
     async def add_tool(self, tool: Any): #tool是一个batch对象
         """添加工具：如果是 MCP 批处理对象，则自动展开"""
@@ -20,6 +21,7 @@ class ToolRegistry:
         """注册单个工具"""
         if hasattr(tool, 'name'):
             self._tools[tool.name] = tool
+            self._schemas = None
             print(f"工具 '{tool.name}' 注册成功")
 
     def get_tool(self, name: str) -> Optional[Any]:
@@ -27,8 +29,10 @@ class ToolRegistry:
         return self._tools.get(name)
 
     def get_all_tool_schemas(self) -> List[Dict]:#需要给LLM看，所以要转换成dict格式
-        """汇总所有工具的 OpenAI 格式说明书"""
-        return [t.to_dict() for t in self._tools.values()]
+        """汇总所有工具的 OpenAI 格式说明书（只生成一次）"""
+        if self._schemas is None:
+            self._schemas = [t.to_dict() for t in self._tools.values()]
+        return self._schemas
 
     def list_tools(self) -> List[str]:
         return list(self._tools.keys())
@@ -1,30 +1,46 @@
 #==================Orchestrator（总控）=====================#
 import re
 import traceback
+from typing import List, Tuple
 from pyexpat import model
 
 from pydantic_core import SchemaSerializer
 from requests import models
-from amap_mcp import AmapMCPBatch
+from amap_mcp import AmapMCPBatch, MCPToolCatalog
 from SimpleAgent import SimpleAgent
+from stage_scheduler import Stage, StageScheduler, ScheduleReport
+from context_manager import budget_sections
+from geo import optimize_day_route, optimize_plan_routes, cluster_into_days
 from system_prompt import ATTRACTION_AGENT_PROMPT,HOTEL_AGENT_PROMPT,WEATHER_AGENT_PROMPT,PLANNER_AGENT_PROMPT
 from models.schemas import TripRequest, TripPlan, DayPlan, Attraction, Meal, WeatherInfo, Location, Hotel
+from poi_store import POIStore, poi_store_var, ground_days, ground_weather_info, ATTRACTION_TOOLS
+from prefetch import Prefetcher, prefetcher_var
+from direct_expert import DirectExpert, weather_calls, hotel_calls
 class TripMaster:
-    def __init__(self, llm, mcp_session): #接收已经建立好的session,连接与业务分离
+    def __init__(self, llm, mcp_pool, catalog: MCPToolCatalog = None, prefetch: bool = True,
+                 direct_experts=("weather_expert", "hotel_expert"), direct_summary: bool = False): #接收已经启动好的 MCP 进程池,连接与业务分离
         self.llm = llm
-        self.session = mcp_session
+        self.pool = mcp_pool
+        self.catalog = catalog or MCPToolCatalog(mcp_pool)  # 所有专家共享一份工具目录
+        self.expert_context_tokens = 3000  # 传给规划专家的专家输出总 token 上限
+        self.prefetch = prefetch  # 规划开始时并发预取天气/偏好景点/酒店搜索
+        self.direct_experts = set(direct_experts)  # 以 direct 模式运行的专家（直接调用工具，不走 ReAct 循环）
+        self.direct_summary = direct_summary  # direct 模式下是否再用一次 LLM 总结工具结果
         self.agents = {} #
+        self.scheduler = self._build_stages()
 
     async def initialize_team(self):
         """
         一键初始化函数：封装了工具注册和 Agent 创建
         """
         # 1. 定义专家及其需要的工具关键词
+        # calls 给出 direct 模式下根据请求直接执行的工具调用；专家在 direct_experts 中时启用
         team_config = {
             "weather_expert": {
                 "role": "天气专家",
                 "prompt": WEATHER_AGENT_PROMPT,
-                "keywords": ["weather"]
+                "keywords": ["weather"],
+                "calls": weather_calls
             },
             "attraction_agent":{
                 "role":"景点推荐专家",
@@ -34,7 +50,8 @@ class TripMaster:
             "hotel_expert": {
                 "role": "酒店推荐专家",
                 "prompt": HOTEL_AGENT_PROMPT,
-                "keywords": ["hotel_search", "poi_detail","search_nearby"]
+                "keywords": ["hotel_search", "poi_detail","search_nearby"],
+                "calls": hotel_calls
             },
             "trip_planner": {
                 "role": "行程规划专家",
@@ -44,24 +61,134 @@ class TripMaster:
             }
         }
 
-        # 2. 自动化循环创建并配发工具
+        # 2. 只拉取一次工具目录，之后各专家按关键字从中筛选
+        await self.catalog.get_tools()
+
+        # 3. 自动化循环创建并配发工具
         for key, cfg in team_config.items():
             # 逐个创建 Agent
-            agent = SimpleAgent(
-                name=cfg["role"],
-                llm=self.llm,
-                system_prompt=cfg["prompt"]
-            )
+            if key in self.direct_experts and cfg.get("calls"):
+                agent = DirectExpert(name=cfg["role"], llm=self.llm, system_prompt=cfg["prompt"],
+                                     calls=cfg["calls"], summarize=self.direct_summary)
+            else:
+                agent = SimpleAgent(
+                    name=cfg["role"],
+                    llm=self.llm,
+                    system_prompt=cfg["prompt"]
+                )
             # 自动化按需索取工具
-            if agent.name is not "行程规划专家":
-                batch = AmapMCPBatch(self.session, include_keywords=cfg["keywords"])
+            if agent.name != "行程规划专家":
+                batch = AmapMCPBatch(self.pool, include_keywords=cfg["keywords"], catalog=self.catalog)
                 await agent.add_tool(batch)
             
             self.agents[key] = agent
-            print(f"--{agent.name}已创建--")
+            print(f"--{agent.name}已创建{'（direct 模式）' if isinstance(agent, DirectExpert) else ''}--")
         
         print(f"旅行专家团初始化完成：已激活 {len(self.agents)} 名专家。")
 
+    def _build_stages(self) -> StageScheduler:
+        """
+        把规划流程声明为阶段 DAG：
+        weather 与 attractions 互不依赖，可并行；hotel 只依赖景点坐标；
+        cluster 把候选景点按地理位置分到每一天；planner 汇总全部结果。
+        poi_store 汇总本次规划中高德工具返回的结构化 POI 记录，供 hotel / cluster / planner 直接读取。
+        """
+        return StageScheduler([
+            Stage("weather", self._stage_weather, inputs=["request"], outputs=["weather_data"]),
+            Stage("attractions", self._stage_attractions, inputs=["request"], outputs=["attractions_data"]),
+            Stage("hotel", self._stage_hotel, inputs=["request", "attractions_data", "poi_store"],
+                  outputs=["hotels_data"]),
+            Stage("cluster", self._stage_cluster, inputs=["request", "attractions_data", "poi_store"],
+                  outputs=["day_groups"]),
+            Stage("planner", self._stage_planner,
+                  inputs=["request", "weather_data", "attractions_data", "hotels_data", "day_groups", "poi_store",
+                          "on_event"],
+                  outputs=["trip_plan"]),
+        ])
+
+    async def _stage_weather(self, request: TripRequest) -> str:
+        print("🌤️ 正在同步气象信息...")
+        weather_query = f"查询{request.city}在 {request.start_date} 到{request.end_date}期间的天气预报。"
+        expert = self.agents["weather_expert"]
+        if isinstance(expert, DirectExpert):
+            return await expert.run_direct(request, query=weather_query)
+        return await expert.run(weather_query)
+
+    async def _stage_attractions(self, request: TripRequest) -> str:
+        print("📍 正在检索目的地景点...")
+        attr_query = f"请搜索{request.city}中关于'{', '.join(request.preferences)}'偏好的景点。"
+        return await self.agents["attraction_agent"].run(attr_query)
+
+    async def _stage_hotel(self, request: TripRequest, attractions_data: str, poi_store: POIStore) -> str:
+        print("🏨 正在筛选酒店...")
+        # 以景点专家推荐的景点（来自工具记录）的中心为酒店搜索中心
+        center = POIStore.centroid(self.candidate_records(attractions_data, poi_store))
+        center = center or self.extract_last_coord(attractions_data)
+        hotel_query = f"请基于坐标 {center}搜索该坐标附近符合'{request.accommodation}'标准或者交通便利的酒店。"
+        expert = self.agents["hotel_expert"]
+        if isinstance(expert, DirectExpert):
+            return await expert.run_direct(request, query=hotel_query, center=center)
+        return await expert.run(hotel_query)
+
+    def candidate_records(self, attractions_data: str, poi_store: POIStore) -> List[dict]:
+        """景点专家回复中提到的 POI 记录；专家没有逐个点名时取景点搜索返回的全部记录"""
+        return (poi_store.mentioned_in(attractions_data, ATTRACTION_TOOLS)
+                or poi_store.records(ATTRACTION_TOOLS))
+
+    async def _stage_cluster(self, request: TripRequest, attractions_data: str, poi_store: POIStore) -> str:
+        """把候选景点聚类成 travel_days 组，生成按天分组的紧凑候选表；坐标不足时返回空串"""
+        pois = [{"name": r["name"], "address": r["address"], "location": Location(longitude=r["lon"], latitude=r["lat"])}
+                for r in self.candidate_records(attractions_data, poi_store)]
+        if not pois:
+            # 工具未返回结构化记录（如旧格式的缓存结果）时退回到解析专家文本
+            pois = self.parse_candidate_pois(attractions_data)
+        if len(pois) < 2:
+            return ""
+        groups = cluster_into_days(pois, request.travel_days)
+        print(f"🗺️ 已将 {len(pois)} 个候选景点按地理位置分为 {len(groups)} 组")
+        lines = []
+        for day, group in enumerate(groups, 1):
+            lines.append(f"第{day}天:")
+            for p in group:
+                loc = p["location"]
+                lines.append(f"  - {p['name']} | {p['address'] or '地址未知'} | {loc.longitude},{loc.latitude}")
+        return "\n".join(lines)
+
+    async def _stage_planner(self, request: TripRequest, weather_data: str,
+                             attractions_data: str, hotels_data: str, day_groups: str = "",
+                             poi_store: POIStore = None, on_event=None) -> TripPlan:
+        print("📋 整合全量数据并生成结构化行程...")
+        planner_query = self._build_final_planner_prompt(request, attractions_data, weather_data, hotels_data,
+                                                         day_groups)
+        if on_event is None:
+            # 核心修改：利用 run_structured 直接获取 Pydantic 对象
+            trip_plan = await self.agents["trip_planner"].run_structured(planner_query, TripPlan)
+            self._ground(trip_plan.days, poi_store, trip_plan)
+            # 每日景点顺序由本地路线优化决定，而不是交给 LLM 推理
+            return optimize_plan_routes(trip_plan)
+
+        # 流式模式：每生成完一天的行程就推送给调用方
+        trip_plan = None
+        async for item in self.agents["trip_planner"].run_structured_stream(planner_query, TripPlan):
+            if isinstance(item, DayPlan):
+                self._ground([item], poi_store)
+                await on_event("day", "planner", optimize_day_route(item))
+            else:
+                trip_plan = item
+        self._ground(trip_plan.days, poi_store, trip_plan)
+        return optimize_plan_routes(trip_plan)
+
+    @staticmethod
+    def _ground(days: List[DayPlan], poi_store: POIStore, trip_plan: TripPlan = None):
+        """用工具返回的真实 POI 记录与逐日预报校正行程中的坐标、地址、酒店价格与天气"""
+        if poi_store is None:
+            return
+        fixes = ground_days(days, poi_store)
+        if fixes:
+            print(f"📌 已按高德记录校正行程中的 {fixes} 处坐标/地址/价格/天气")
+        if trip_plan is not None and ground_weather_info(trip_plan, poi_store):
+            print(f"🌦️ 已用高德逐日预报替换行程天气概况（{len(trip_plan.weather_info)} 天）")
+
     async def create_plan(self,request:TripRequest):
         """
         使用多智能体协作生成旅行计划
@@ -70,40 +197,58 @@ class TripMaster:
         Returns:
             旅行计划
         """
-        try:
-            # 1. 获取天气概况
-            print("🌤️ 步骤 1: 正在同步气象信息...")
-            weather_query = f"查询{request.city}在 {request.start_date} 到{request.end_date}期间的天气预报。"
-            weather_data = await self.agents["weather_expert"].run(weather_query)
-            #weather=weather_data[]
-            # 2. 获取景点数据
-            print("📍 步骤 2: 正在检索目的地景点...")
-            attr_query = f"请根据{weather_data}搜索{request.city}中关于'{', '.join(request.preferences)}'偏好的景点。"
-            attractions_data = await self.agents["attraction_agent"].run(attr_query)
-            last_poi_coord = self.extract_last_coord(attractions_data)
-
-            # 3. 获取住宿建议
-            print("🏨 步骤 3: 正在筛选酒店...")
-            hotel_query = f"请基于坐标 {last_poi_coord}搜索该坐标附近符合'{request.accommodation}'标准或者交通便利的酒店。"
-            hotels_data = await self.agents["hotel_expert"].run(hotel_query)
-
-            # 4. 结构化整合生成最终计划
-            print("📋 步骤 4: 整合全量数据并生成结构化行程...")
-            planner_query = self._build_final_planner_prompt(request, attractions_data, weather_data, hotels_data)
+        trip_plan, _ = await self.create_plan_with_report(request)
+        return trip_plan
 
-            # 核心修改：利用 run_structured 直接获取 Pydantic 对象
-            trip_plan = await self.agents["trip_planner"].run_structured(planner_query, TripPlan)
-            return trip_plan
+    async def create_plan_with_report(self, request: TripRequest,
+                                      on_event=None) -> Tuple[TripPlan, ScheduleReport]:
+        """
+        与 create_plan 相同，额外返回各阶段耗时与关键路径报告。
+        on_event(event, stage, payload) 可选，用于向调用方推送阶段开始/完成事件（如 SSE）；
+        提供时规划阶段改为流式生成，每完成一天行程推送一次 "day" 事件。
+        """
+        # 可预测的工具调用在第一轮 LLM 思考的同时发出，专家以相同参数调用时直接复用
+        # （先取工具目录再设置上下文变量：取目录失败时不会留下未重置的变量）
+        prefetcher = None
+        if self.prefetch:
+            prefetcher = Prefetcher({t.name: t for t in await self.catalog.get_tools()})
+        # 本次规划专用的 POI 记录：工具调用在本上下文派生的协程中执行，会把记录写入这里
+        poi_store = POIStore()
+        token = poi_store_var.set(poi_store)
+        prefetch_token = prefetcher_var.set(prefetcher)
+        try:
+            if prefetcher:
+                prefetcher.start(request)
+            context = {"request": request, "on_event": on_event, "poi_store": poi_store}
+            report = await self.scheduler.run(context, on_event=on_event)
+            print(f"⏱️ {report.summary()}")
+            return context["trip_plan"], report
         except Exception as e:
             print(f"❌ 规划失败: {str(e)}")
             traceback.print_exc()
             # 这里可以调用一个 fallback 逻辑返回基础行程
             raise e
-    
-    def _build_final_planner_prompt(self, request: TripRequest, attractions: str, weather: str, hotels: str) -> str:
+        finally:
+            if prefetcher:
+                prefetcher.close()
+            prefetcher_var.reset(prefetch_token)
+            poi_store_var.reset(token)
+
+    def _build_final_planner_prompt(self, request: TripRequest, attractions: str, weather: str, hotels: str,
+                                    day_groups: str = "") -> str:
         """构建最终的上下文 Prompt"""
+        if day_groups:
+            # 有按天分组的候选表时，用它代替景点专家的整段原文（分组规则在规划专家的 system prompt 中）
+            attractions = f"以下候选景点已按地理位置分好组，每组对应一天（名称 | 地址 | 经度,纬度）：\n{day_groups}"
+        # 专家输出按比例截断到预算内，避免规划阶段 prompt 无限膨胀
+        sections = budget_sections(
+            {"attractions": attractions, "weather": weather, "hotels": hotels},
+            self.expert_context_tokens
+        )
+        attractions, weather, hotels = sections["attractions"], sections["weather"], sections["hotels"]
+        # 只包含本次请求的数据；固定的规划要求与输出结构都在 system 消息里，保持请求前缀不变
         final_query =  f"""请根据以下多方数据，为用户规划一个完美的旅行计划。
-        ### 1. 用户基本需求
+### 1. 用户基本需求
 - 目的地: {request.city}
 - 日期: {request.start_date} 至 {request.end_date} ({request.travel_days}天)
 - 交通/住宿偏好: {request.transportation} / {request.accommodation}
@@ -117,20 +262,40 @@ class TripMaster:
 {weather}
 - **酒店推荐**: 
 {hotels}
-
-### 3. 要求
-1. 每天安排2-3个景点
-2. 每天的行程必须包含景点列表 (`attractions`) 和至少三餐 (`meals`)。
-3. 每天推荐一个具体的酒店(从酒店信息中选择)
-4. 考虑景点之间的距离和交通方式
-5. 景点经纬度必须基于搜索结果中的真实数据。
-6.`overall_suggestions` 需要结合天气情况给出穿衣或出行建议。
-7. 必须严格遵守TripPlan的JSON结构,返回完整的JSON格式数据
 """
 
         return final_query
 
 
+    def parse_candidate_pois(self, text: str) -> List[dict]:
+        """从景点专家的文本中解析带坐标的候选景点：[{name, address, location}]"""
+        pois, seen, prev_name = [], set(), ""
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            name_match = re.search(r"名称[:：]\s*([^,，|\n]+)", line)
+            name = name_match.group(1) if name_match else re.split(r"[:：,，(（|]|\s-\s", re.sub(r"^[\s\-*#>\d.、]+", "", line))[0]
+            name = name.replace("*", "").strip(" `")
+            coord = re.search(r"(-?\d{1,3}\.\d+)\s*[,，]\s*(-?\d{1,2}\.\d+)", line)
+            if not coord:
+                prev_name = name
+                continue
+            # “坐标: x,y” 单独成行时，名称取自上一行
+            if not name or name in ("坐标", "经纬度", "位置", "location"):
+                name = prev_name
+            lon, lat = float(coord.group(1)), float(coord.group(2))
+            if not name or name in seen or not (-180 <= lon <= 180 and -90 <= lat <= 90):
+                continue
+            address = re.search(r"地址[:：]\s*([^,，|\n]+)", line)
+            pois.append({
+                "name": name,
+                "address": address.group(1).strip() if address else "",
+                "location": Location(longitude=lon, latitude=lat),
+            })
+            seen.add(name)
+        return pois
+
 # 💡 核心修复：新增辅助方法用于提取坐标
     def extract_last_coord(self, text: str) -> str:
         """从专家返回的文本中提取最后一组经纬度坐标"""